@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import confluence.api as api
+
+# asyncio twin of the confluence.api surface.
+# Each call runs the blocking api function in the default executor so that
+# many page operations can be in flight from one event loop while still
+# sharing the pooled session in confluence.net. Use run() to have as
+# many threads as calls in flight.
+# Make sure the pool size given to confluence.net.create_session() is
+# not smaller than the number of requests you keep in flight.
+
+
+async def _run(fun, *args):
+    return await asyncio.to_thread(fun, *args)
+
+
+def run(main, jobs):
+    # asyncio.run(main) with a default executor of jobs threads.
+    # The executor asyncio makes by itself has min(32, cpu_count + 4)
+    # threads, which would silently cap the calls in flight below jobs.
+    async def with_executor():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=jobs))
+        return await main
+    return asyncio.run(with_executor())
+
+
+async def get_space(url, auth):
+    return await _run(api.get_space, url, auth)
+
+
+async def get_children(url, auth, page_id):
+    return await _run(api.get_children, url, auth, page_id)
+
+
+async def list_children(url, auth, page_id):
+    return await _run(api.list_children, url, auth, page_id)
+
+
+async def get_page_by_id(url, auth, page_id, body_format='storage', body_cache=None):
+    return await _run(api.get_page_by_id, url, auth, page_id, body_format, body_cache)
+
+
+async def copy_page(url, auth, src_page, to_page, new_title, cache=None, copy_descendants=True) -> (int, dict):
+    return await _run(api.copy_page, url, auth, src_page, to_page, new_title, cache, copy_descendants)
+
+
+async def update_page(url, auth, page_id, transform, space_id, new_title) -> (int, dict):
+    return await _run(api.update_page, url, auth, page_id, transform, space_id, new_title)
+
+
+async def rename_page(url, auth, page_id, new_title):
+    return await _run(api.rename_page, url, auth, page_id, new_title)
+
+
+async def get_page_handle(url, auth, page_id):
+    return await _run(api.get_page_handle, url, auth, page_id)
+
+
+async def write_page(url, auth, handle, change, cache=None):
+    return await _run(api.write_page, url, auth, handle, change, cache)
+
+
+async def get_long_running_task_by_id(url, auth, task_id) -> (int, dict):
+    return await _run(api.get_long_running_task_by_id, url, auth, task_id)
+
+
+def long_task_id(resp) -> Optional[str]:
+    # A request that is processed in background returns a reference to a
+    # long running task instead of the result.
+    if not isinstance(resp, dict):
+        return None
+    status = resp.get('links', {}).get('status', '')
+    if 'longtask' in status and 'id' in resp:
+        return str(resp['id'])
+    return None
+
+
+def task_page_ids(task) -> list[str]:
+    # Ids of the pages a finished copy task created.
+    details = task.get('additionalDetails') or {}
+    if 'destinationId' in details:
+        return [str(details['destinationId'])]
+    return []
+
+
+async def wait_for_task(url, auth, task_id, interval=0.5, max_interval=10.0) -> (int, dict):
+    # Poll a long running task until it finishes.
+    # The interval is kept while the task makes progress and grows up to
+    # max_interval while it doesn't, so that slow tasks are polled less.
+    # Returns the last status code and task. A failed poll is returned as is.
+    progress = None
+    while True:
+        (sc, task) = await get_long_running_task_by_id(url, auth, task_id)
+        if sc != 200 or task.get('finished'):
+            return (sc, task)
+        curr = task.get('percentageComplete')
+        if curr == progress:
+            interval = min(max_interval, interval * 1.5)
+        progress = curr
+        logging.debug(f"task {task_id} {curr}% done, poll again in {interval:.1f}s")
+        await asyncio.sleep(interval)
+
+
+async def wait_for_tasks(url, auth, task_ids, interval=0.5, max_interval=10.0) -> list:
+    # Poll many tasks at once. Results are in task_ids order.
+    return await asyncio.gather(*[wait_for_task(url, auth, task_id, interval, max_interval)
+                                  for task_id in task_ids])
+
+
+def copy_result(task_id, sc, task) -> (int, list | dict):
+    # Ids of the pages a finished copy task created, or the failure.
+    if sc != 200:
+        return (sc, task)
+    if not task.get('successful', False):
+        logging.error(f"copy task {task_id} failed: {task.get('messages')}")
+        return (500, task)
+    return (200, task_page_ids(task))
+
+
+async def copy_page_and_wait(url, auth, src_page, to_page, new_title, cache=None) -> (int, list | dict):
+    # Copy a page and resolve to the ids of the created pages, waiting
+    # for the long running task if the copy goes to background.
+    (sc, res) = await _run(api.copy_page, url, auth, src_page, to_page, new_title, cache)
+    if sc not in (200, 202):
+        return (sc, res)
+    task_id = long_task_id(res)
+    if task_id is None:
+        return (sc, [str(res['id'])])
+    (sc_task, task) = await wait_for_task(url, auth, task_id)
+    return copy_result(task_id, sc_task, task)
+
+
+async def gather_limited(coros, limit) -> list:
+    # Same as asyncio.gather() but at most limit coroutines run at once.
+    # Exceptions are returned in place of the result so that one failure
+    # doesn't cancel the rest of the batch.
+    assert limit > 0
+    sem = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with sem:
+            return await coro
+
+    return await asyncio.gather(*[run(c) for c in coros], return_exceptions=True)
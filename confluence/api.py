@@ -1,14 +1,17 @@
-import datetime
 import json
 import logging
 import time
-import urllib
+from dataclasses import dataclass, field, replace
+import re
+import urllib.parse
 from typing import Optional
 
 import requests
 
-from confluence.content import create_fake_root, create_body
-from confluence.net import get, multi_get, put, post, multi_get_v2, format_query_parameter
+from confluence.storage import default_codec
+from confluence.title import compile_title_format
+from confluence.net import get, multi_get, put, post, multi_get_v2, iter_get, iter_get_v2, format_query_parameter, \
+    decode_json
 
 
 def get_space(url, auth):
@@ -16,53 +19,219 @@ def get_space(url, auth):
     (sc, res) = multi_get_v2(space_url, auth, 20)
     return (sc, res)
 
-def get_page_by_id(url, auth, page_id, body_format='storage'):
+def get_page_by_id(url, auth, page_id, body_format='storage', body_cache=None):
+    # With body_cache, only the current version number is asked first and
+    # the body is served locally if the cache has that version.
+    if body_cache is not None:
+        (sc_ver, version) = get_latest_version_number(url, auth, page_id)
+        if sc_ver == 200:
+            page = body_cache.get(page_id, version, body_format)
+            if page is not None:
+                return (200, page)
     request_url = f"{url}/wiki/api/v2/pages/{page_id}?"
     response = get(request_url, auth, {"body-format":body_format})
-    return (response.status_code, json.loads(response.text))
+    resp = decode_json(response)
+    if response.status_code == 200 and body_cache is not None:
+        body_cache.put(resp, body_format)
+    return (response.status_code, resp)
 
 def get_page_version_by_id(url, auth, page_id) -> (int, dict):
     request_url = f"{url}/wiki/api/v2/pages/{page_id}/versions"
     response = get(request_url, auth)
-    return (response.status_code, json.loads(response.text))
+    return (response.status_code, decode_json(response))
 
-def get_children(url, auth, page_id):
+def get_latest_version_number(url, auth, page_id) -> (int, Optional[int]):
+    request_url = f"{url}/wiki/api/v2/pages/{page_id}/versions?"
+    response = get(request_url, auth, {"sort": "-modified-date", "limit": 1})
+    if response.status_code != 200:
+        return (response.status_code, None)
+    results = decode_json(response)['results']
+    if results == []:
+        return (404, None)
+    return (200, results[0]['number'])
+
+
+def get_children(url, auth, page_id, cache=None):
+    if cache is not None:
+        children = cache.get(page_id)
+        if children is not None:
+            return children
     page_children_url = f"{url}/wiki/api/v2/pages/{page_id}/children?"
     (sc, res) = multi_get_v2(page_children_url, auth, 20)
     if sc == 200:
+        if cache is not None:
+            cache.put(page_id, res['results'])
         return res['results']
     else:
         logging.error("get_children failed")
         return []
 
+def iter_children(url, auth, page_id):
+    # Same as get_children() but yields children while later pages are fetched.
+    page_children_url = f"{url}/wiki/api/v2/pages/{page_id}/children?"
+    return iter_get_v2(page_children_url, auth, 20)
+
+
+def list_children(url, auth, page_id) -> list:
+    # Same as get_children() but a failure raises requests.HTTPError
+    # instead of looking like a page without children.
+    return list(iter_children(url, auth, page_id))
+
+
+@dataclass
+class PageHandle:
+    # What a write needs to know about a page. It is carried over from the
+    # previous response so that a write doesn't have to GET the page again.
+    id: str
+    title: str
+    space_id: str
+    version: int
+    body: str
+
 
-def rename_page(url, auth, page_id, new_title):
-    (sc_page, res_page) = get_page_by_id(url, auth, page_id)
-    if sc_page != 200:
-        return (sc_page, json.loads(res_page.text))
-    src_page = res_page
+def page_handle_from_v2(resp) -> PageHandle:
+    # resp is a v2 page with body-format=storage
+    return PageHandle(str(resp['id']), resp['title'], str(resp['spaceId']),
+                      resp['version']['number'], resp['body']['storage']['value'])
 
-    rename_page_url = f"{url}/wiki/api/v2/pages/{src_page['id']}"
-    src_page['version']['number'] = src_page['version']['number'] + 1
+
+def page_handle_from_v1(resp, space_id) -> Optional[PageHandle]:
+    # resp is a v1 content expanded with body.storage and version.
+    # v1 content has a space key but not a space id, so space_id is given.
+    try:
+        return PageHandle(str(resp['id']), resp['title'], str(space_id),
+                          resp['version']['number'], resp['body']['storage']['value'])
+    except (KeyError, TypeError):
+        return None
+
+
+def get_page_handle(url, auth, page_id, body_cache=None) -> (int, PageHandle | dict):
+    (sc, resp) = get_page_by_id(url, auth, page_id, 'storage', body_cache)
+    if sc != 200:
+        return (sc, resp)
+    return (sc, page_handle_from_v2(resp))
+
+
+def put_page(url, auth, handle, title, body) -> requests.Response:
+    put_page_url = f"{url}/wiki/api/v2/pages/{handle.id}"
     payload = json.dumps({
-        "id": src_page['id'],
+        "id": handle.id,
         "status": "current",
-        "title": new_title,
-        "spaceId": src_page['spaceId'],
-        'body': {
-            "representation":"storage",
-            "value":src_page['body']['storage']['value'],
+        "title": title,
+        "spaceId": handle.space_id,
+        "body": {
+            "representation": "storage",
+            "value": body,
+        },
+        "version": {
+            "number": handle.version + 1
         },
-        'version':src_page['version'],
-        "type": "page",
-        "status": "current"
     })
-    res = put(rename_page_url, auth, payload)
-    return (res.status_code, json.loads(res.text))
+    return put(put_page_url, auth, payload)
+
+
+def write_page(url, auth, handle, change, cache=None) -> (int, dict, PageHandle):
+    # change(handle) returns (title, body) to be written over handle.
+    # The version in handle is trusted. Only when the server reports a
+    # version conflict, the page is fetched again and change is applied
+    # to the latest one. If the latest one is what we sent, e.g. the PUT
+    # was applied but the response was lost, the write is done already and
+    # change is not applied twice.
+    # Returns the handle of the written page for the next write.
+    (title, body) = change(handle)
+    res = put_page(url, auth, handle, title, body)
+    if res.status_code == 409:
+        logging.info(f"version conflict on {handle.id}, fetch it again")
+        (sc, resp) = get_page_by_id(url, auth, handle.id)
+        if sc != 200:
+            return (sc, resp, handle)
+        latest = replace(page_handle_from_v2(resp), space_id=handle.space_id)
+        if latest.version == handle.version + 1 and latest.title == title and latest.body == body:
+            logging.info(f"{handle.id} already has the written version {latest.version}")
+            if cache is not None:
+                cache.update_page({'id': handle.id, 'title': title})
+            return (200, resp, latest)
+        handle = latest
+        (title, body) = change(handle)
+        res = put_page(url, auth, handle, title, body)
+    if res.status_code != 200:
+        return (res.status_code, decode_json(res), handle)
+    if cache is not None:
+        cache.update_page({'id': handle.id, 'title': title})
+    written = replace(handle, title=title, version=handle.version + 1, body=body)
+    return (res.status_code, decode_json(res), written)
+
+
+@dataclass
+class PagePlan:
+    # Changes to one page that are written by a single versioned PUT.
+    # Storage body transforms are applied in order and the title is
+    # replaced if given.
+    page_id: str
+    title: Optional[str] = None
+    transforms: list = field(default_factory=list)
+    space_id: Optional[str] = None
+
+    def rename(self, title) -> 'PagePlan':
+        self.title = title
+        return self
+
+    def transform(self, fun) -> 'PagePlan':
+        self.transforms.append(fun)
+        return self
+
+    def is_empty(self) -> bool:
+        return self.title is None and self.transforms == []
+
+    def change(self, handle) -> (str, str):
+        body = handle.body
+        for fun in self.transforms:
+            body = transform_storage(body, fun)
+        title = handle.title if self.title is None else self.title
+        return (title, body)
+
+
+def merge_plans(plans) -> list[PagePlan]:
+    # Fold plans for the same page into one so that the page is written once.
+    # Later renames win and transforms are applied in the given order.
+    merged = {}
+    for plan in plans:
+        key = str(plan.page_id)
+        if key not in merged:
+            merged[key] = PagePlan(plan.page_id, None, [], plan.space_id)
+        curr = merged[key]
+        curr.transforms.extend(plan.transforms)
+        if plan.title is not None:
+            curr.title = plan.title
+        if plan.space_id is not None:
+            curr.space_id = plan.space_id
+    return list(merged.values())
+
+
+def apply_plan(url, auth, plan, cache=None, handle=None, body_cache=None) -> (int, dict):
+    # Give handle to skip fetching the page.
+    if plan.is_empty():
+        return (200, {})
+    if handle is None:
+        (sc_page, handle) = get_page_handle(url, auth, plan.page_id, body_cache)
+        if sc_page != 200:
+            return (sc_page, handle)
+    if plan.space_id is not None:
+        handle = replace(handle, space_id=str(plan.space_id))
+
+    (sc, res, _) = write_page(url, auth, handle, plan.change, cache)
+    return (sc, res)
 
 
-def copy_page(url, auth, src_page, to_page, new_title) -> (int, dict):
-    copy_page_url = f"{url}/wiki/rest/api/content/{src_page['id']}/copy"
+def rename_page(url, auth, page_id, new_title, cache=None, handle=None):
+    # Give handle to skip fetching the page.
+    return apply_plan(url, auth, PagePlan(page_id, new_title), cache, handle)
+
+
+def copy_page(url, auth, src_page, to_page, new_title, cache=None, copy_descendants=True) -> (int, dict):
+    # The copied page is returned with its body and version, so that
+    # page_handle_from_v1() can make a handle of it without another GET.
+    copy_page_url = f"{url}/wiki/rest/api/content/{src_page['id']}/copy?expand=body.storage,version"
     prefix = "copy-"
     payload = json.dumps({
         "copyAttachments": True,
@@ -70,7 +239,7 @@ def copy_page(url, auth, src_page, to_page, new_title) -> (int, dict):
         "copyProperties": True,
         "copyLabels": True,
         "copyCustomContents": True,
-        "copyDescendants": True,
+        "copyDescendants": copy_descendants,
         "destination": {
             "type": "parent_page",
             "value": f"{to_page['id']}"
@@ -79,65 +248,93 @@ def copy_page(url, auth, src_page, to_page, new_title) -> (int, dict):
     })
 
     res = post(copy_page_url, auth, payload)
-    return (res.status_code, json.loads(res.text))
-
-
-def update_page(url, auth, page_id, transform, space_id, new_title) -> (int, dict):
-    #expand=body.storage,version.number
-    (status_code, resp) = get_page_by_id(url, auth, page_id)
-    if status_code != 200:
-        return (status_code, resp)
-    curr_body = resp['body']
-    curr_ver = resp['version']['number']
-
-    update_page_url = f"{url}/wiki/api/v2/pages/{page_id}"
-    # As ElementTree doesn't allow us to use undefined xmlns,
-    # create a fake xml tree using dummy name space seems required.
-    dic = {"ac": "https://example.com/ac", "ri": "http://example.com/ri"}
-    root = create_fake_root(curr_body['storage']['value'], dic)
+    if cache is not None:
+        # to_page got a new child.
+        cache.invalidate(to_page['id'])
+    return (res.status_code, decode_json(res))
+
+
+def transform_storage(value, transform, codec=default_codec) -> str:
+    root = codec.parse(value)
     transformed_root = transform(root)
-    transformed_body = create_body(curr_body, transformed_root, dic)
-    payload2 = json.dumps({
-        "id": f"{page_id}",
-        "status": "current",
-        "title": f"{new_title}",
-        "spaceId": f"{space_id}",
-        "body": {
-            "representation": "storage",
-            "value": transformed_body,
-        },
-        "version": {
-            "number": curr_ver + 1
-        },
-    })
-    response2 = put(update_page_url, auth, payload2)
-    return (response2.status_code, json.loads(response2.text))
+    return codec.serialize(transformed_root)
+
+
+def update_page(url, auth, page_id, transform, space_id, new_title, cache=None, handle=None) -> (int, dict):
+    # The body transform and the new title go in one PUT.
+    # Give handle to skip fetching the page.
+    plan = PagePlan(page_id, new_title, [transform], space_id)
+    return apply_plan(url, auth, plan, cache, handle)
 
 
 def get_long_running_task_by_id(url, auth, task_id) -> (int, dict):
     get_url = f"{url}/wiki/rest/api/longtask/{task_id}"
     res = get(get_url, auth)
-    return (res.status_code, json.loads(res.text))
+    return (res.status_code, decode_json(res))
+
 
+def select_page(pages, comp) -> Optional[dict]:
+    # find a top level page with the newest datetime.
+    # Exact same title gets maximum priority.
+    ranked = compile_title_format(comp).rank(pages)
+    if ranked == []:
+        return None
+    (dt, page) = ranked[0]
+    logging.debug(f"{page['title']} {comp} {dt}")
+    return page
 
-def find_page_by_path(url, auth, top_pages, components) -> Optional[dict]:
+
+def find_children_by_title(url, auth, page_id, comp, space_id=None) -> Optional[list]:
+    # Ask the server only for the children of page_id whose title can match comp.
+    # An exact title is looked up with the v2 title filter, within space_id
+    # if it is given. A title format is
+    # narrowed down by CQL with the leading word of its literal prefix.
+    # The result can contain extra pages, select_page() does the real match.
+    # Returns None if comp can't be expressed as a filter or the server
+    # refuses it, then the caller has to scan all the children.
+    matcher = compile_title_format(comp)
+    if matcher.literal:
+        request_url = f"{url}/wiki/api/v2/pages?"
+        extra = {"title": urllib.parse.quote(comp)}
+        if space_id is not None:
+            extra["space-id"] = space_id
+        (sc, res) = multi_get_v2(request_url, auth, 20, extra)
+        if sc != 200:
+            logging.info(f"title filter failed with {sc}")
+            return None
+        return [page for page in res['results'] if str(page.get('parentId')) == str(page_id)]
+
+    word = re.match("[a-z0-9]+", matcher.prefix)
+    if word is None:
+        return None
+    cql = f'parent = {page_id} and title ~ "{word.group(0)}*"'
+    search_url = f"{url}/wiki/rest/api/content/search?"
+    try:
+        return list(iter_get(search_url, auth, 25, {"cql": urllib.parse.quote(cql)}))
+    except requests.HTTPError as ex:
+        logging.info(f"CQL search failed: {ex}")
+        return None
+
+
+def get_candidate_children(url, auth, page_id, comps, cache=None, server_filter=False, space_id=None) -> list:
+    # Children of page_id that are looked up against comps.
+    # A cached full listing is preferred since it costs no request.
+    # CQL runs on the search index which is updated with a delay, so a
+    # filtered result without a match falls back to the full listing.
+    if server_filter and cache is None and len(comps) == 1:
+        children = find_children_by_title(url, auth, page_id, comps[0], space_id)
+        if children is not None and select_page(children, comps[0]) is not None:
+            return children
+    return get_children(url, auth, page_id, cache)
+
+
+def find_page_by_path(url, auth, top_pages, components, cache=None, server_filter=False,
+                      space_id=None) -> Optional[dict]:
     if components == []:
         return None
     curr_comp = components[0]
     rest = components[1:]
-    curr_page = None
-    curr_dt = datetime.datetime.min  # initial value is the minimum
-    # find a top level page with the newest datetime.
-    for page in top_pages:
-        title = page['title']
-        (interpreted_comp, dt) = interpret_as_datetime(title, curr_comp)
-        logging.debug(f"{title} {curr_comp} {interpreted_comp}")
-        if title == interpreted_comp and curr_dt < dt:
-            # Newesst date gets higher priority
-            curr_dt = dt
-            curr_page = page
-            if curr_dt == datetime.datetime.max:
-                break
+    curr_page = select_page(top_pages, curr_comp)
 
     # There is no matched page against curr_comp, you don't have to
     # recursively call this function again.
@@ -147,19 +344,41 @@ def find_page_by_path(url, auth, top_pages, components) -> Optional[dict]:
     if rest == []:
         return curr_page
 
-    children = get_children(url, auth, curr_page['id'])
-    return find_page_by_path(url, auth, children, rest)
+    children = get_candidate_children(url, auth, curr_page['id'], rest[:1], cache, server_filter, space_id)
+    return find_page_by_path(url, auth, children, rest, cache, server_filter, space_id)
+
+
+def find_pages_by_paths(url, auth, top_pages, paths, cache=None, server_filter=False,
+                        space_id=None) -> list[Optional[dict]]:
+    # Resolve many paths at once. The paths are merged into a trie of
+    # components so that a shared prefix is walked only once and the
+    # children of each matched page are fetched only once.
+    # Returns the matched page (or None) for each path in paths order.
+    trie = {}
+    for components in paths:
+        node = trie
+        for comp in components:
+            node = node.setdefault(comp, {})
+
+    found = {}
+    fetched = {}
+
+    def walk(pages, node, prefix):
+        for (comp, sub) in node.items():
+            path = prefix + (comp,)
+            page = select_page(pages, comp)
+            found[path] = page
+            if page is None or sub == {}:
+                continue
+            key = (page['id'], tuple(sub.keys()))
+            if key not in fetched:
+                fetched[key] = get_candidate_children(url, auth, page['id'], list(sub.keys()), cache,
+                                                      server_filter, space_id)
+            walk(fetched[key], sub, path)
+
+    walk(top_pages, trie, ())
+    return [found.get(tuple(components)) for components in paths]
 
 
 def interpret_as_datetime(title, fmt):
-    if title == fmt:
-        # Exact same title gets maximum priority.
-        return (title, datetime.datetime.max)
-    else:
-        try:
-            dt = datetime.datetime.strptime(title, fmt)
-            return (title, dt)
-        except ValueError as ex:
-            # error case means title does not match agaisnt fmt
-            # it means, title get least priority
-            return (None, datetime.datetime.min)
+    return compile_title_format(fmt).match(title)
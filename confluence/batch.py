@@ -0,0 +1,60 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from confluence.content import update_tree
+from confluence.storage import default_codec
+
+
+def transform_bytes(data, transform) -> bytes:
+    # Runs in a worker process. Bodies travel as utf-8 bytes, which are
+    # cheaper to pickle than str.
+    root = default_codec.parse(data.decode("utf-8"))
+    return default_codec.serialize(transform(root)).encode("utf-8")
+
+
+def transform_bodies(bodies, transform=update_tree, workers=None, window=None):
+    # Transform many storage format bodies in a process pool.
+    # transform has to be picklable, i.e. a module level function.
+    # At most window bodies (twice the workers by default) are in flight,
+    # so bodies can be read lazily from an iterator.
+    # Yields the transformed body, or the exception raised for it, in the
+    # order of bodies.
+    if window is None:
+        window = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for body in bodies:
+            if len(pending) >= window:
+                yield result_of(pending.popleft())
+            pending.append(pool.submit(transform_bytes, body.encode("utf-8"), transform))
+        while pending:
+            yield result_of(pending.popleft())
+
+
+def result_of(future):
+    try:
+        return future.result().decode("utf-8")
+    except Exception as ex:
+        return ex
+
+
+def transform_files(files, out_dir, transform=update_tree, workers=None) -> list:
+    # Transform storage format bodies stored in files and write them with
+    # the same names into out_dir.
+    # Returns (file, output file or exception) in files order.
+    def read():
+        for file in files:
+            with open(file, "r", encoding="utf-8") as f:
+                yield f.read()
+
+    res = []
+    for (file, body) in zip(files, transform_bodies(read(), transform, workers)):
+        if isinstance(body, Exception):
+            res.append((file, body))
+            continue
+        out = os.path.join(out_dir, os.path.basename(file))
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(body)
+        res.append((file, out))
+    return res
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import yaml
+
+import confluence.aio as aio
+from confluence.api import find_pages_by_paths, page_handle_from_v1, transform_storage
+
+
+def write_adf(directory, rsp) -> str:
+    json_str = rsp['body']['atlas_doc_format']['value']
+    title = rsp['title'].lower()
+    json_obj = json.loads(json_str)
+    file_name = os.path.join(directory, f"{title}.json")
+    with open(file_name, "w") as f:
+        json.dump(json_obj, f)
+    return file_name
+
+
+async def download_adf_page(url, auth, page_id, directory, body_cache=None) -> str:
+    (sc, rsp) = await aio.get_page_by_id(url, auth, page_id, "atlas_doc_format", body_cache)
+    if sc != 200:
+        raise RuntimeError(f"get_page_by_id({page_id}) failed with {sc}")
+    # decoding and writing run off the loop so that they overlap with
+    # the other fetches.
+    return await asyncio.to_thread(write_adf, directory, rsp)
+
+
+def download_adf(url, auth, page_ids, directory, jobs=1, body_cache=None) -> list:
+    # Download pages in atlas_doc_format with at most jobs requests in flight.
+    # Returns a list of (page_id, file name or exception) in page_ids order.
+    # A failure of one page doesn't stop the others.
+    async def run():
+        coros = [download_adf_page(url, auth, page_id, directory, body_cache) for page_id in page_ids]
+        return await aio.gather_limited(coros, jobs)
+
+    res = aio.run(run(), jobs)
+    for (page_id, r) in zip(page_ids, res):
+        if isinstance(r, BaseException):
+            logging.error(f"download {page_id} failed: {r}")
+    return list(zip(page_ids, res))
+
+
+@dataclass
+class CopyEntry:
+    frm: str
+    into: str
+    title_format: str
+
+
+def load_manifest(path) -> list[CopyEntry]:
+    # The manifest is a yaml list of mappings with from, into and title-format.
+    with open(path, "r") as f:
+        entries = yaml.safe_load(f)
+    return [CopyEntry(e['from'], e['into'], e['title-format']) for e in entries]
+
+
+def bulk_copy(url, auth, top_pages, entries, now, jobs=4, cache=None) -> list:
+    # Copy many page subtrees.
+    # All the from/into paths are resolved in one shared walk, then the copies
+    # are submitted with at most jobs requests in flight. Copies that go to
+    # background are tracked afterwards all together, so a long copy doesn't
+    # hold back the submission of the others.
+    # Returns (entry, page ids or exception) in entries order.
+    paths = []
+    for e in entries:
+        paths.append(e.frm.split('/'))
+        paths.append(e.into.split('/'))
+    pages = find_pages_by_paths(url, auth, top_pages, paths, cache)
+
+    async def submit(entry, src_page, to_page):
+        if src_page is None:
+            raise LookupError(f"src page not found:{entry.frm}")
+        if to_page is None:
+            raise LookupError(f"destination parent not found:{entry.into}")
+        new_title = now.strftime(entry.title_format)
+        (sc, res) = await aio.copy_page(url, auth, src_page, to_page, new_title, cache)
+        if sc not in (200, 202):
+            raise RuntimeError(f"copy {entry.frm} into {entry.into} failed with {sc}: {res}")
+        return res
+
+    async def run():
+        coros = [submit(e, pages[2 * i], pages[2 * i + 1]) for (i, e) in enumerate(entries)]
+        res = await aio.gather_limited(coros, jobs)
+        task_ids = {i: aio.long_task_id(r) for (i, r) in enumerate(res) if not isinstance(r, BaseException)}
+        pending = [(i, task_id) for (i, task_id) in task_ids.items() if task_id is not None]
+        tasks = await aio.wait_for_tasks(url, auth, [task_id for (_, task_id) in pending])
+        for (i, task_id) in task_ids.items():
+            if task_id is None:
+                res[i] = [str(res[i]['id'])]
+        for ((i, task_id), (sc, task)) in zip(pending, tasks):
+            (sc, ids) = aio.copy_result(task_id, sc, task)
+            if sc != 200:
+                res[i] = RuntimeError(f"copy {entries[i].frm} into {entries[i].into} failed with {sc}: {ids}")
+            else:
+                res[i] = ids
+        return res
+
+    res = aio.run(run(), jobs)
+    for (e, r) in zip(entries, res):
+        if isinstance(r, BaseException):
+            logging.error(f"copy {e.frm} failed: {r}")
+    return list(zip(entries, res))
+
+
+def clone_tree(url, auth, src_root, parent, root_title, child_title, space_id,
+               transform=None, jobs=4, workers=None, cache=None) -> list:
+    # Clone src_root and all its descendants under parent.
+    # The pipeline has three stages which overlap:
+    #   1. the children of a source page are listed as soon as the page is cloned
+    #   2. each page is copied (without descendants) with at most jobs requests in flight
+    #   3. the body of each cloned page goes through transform in a process pool
+    #      and is written back with the version the copy returned.
+    # root_title is the title of the cloned src_root and child_title(title)
+    # gives the title of a cloned descendant, since a title has to be unique
+    # in a space.
+    # Returns (source page id, handle of the cloned page or exception) for
+    # every page that was tried. A failed page doesn't stop its siblings,
+    # but its descendants are not cloned. If the children of a cloned page
+    # can't be listed, an exception is returned for that page in addition
+    # to its handle.
+    results = []
+
+    async def clone(sem, src_page, to_page, title):
+        async with sem:
+            (sc, res) = await aio.copy_page(url, auth, src_page, to_page, title, cache, False)
+            if sc != 200:
+                raise RuntimeError(f"copy {src_page['title']} failed with {sc}: {res}")
+            handle = page_handle_from_v1(res, space_id)
+            if handle is None:
+                (sc, handle) = await aio.get_page_handle(url, auth, res['id'])
+                if sc != 200:
+                    raise RuntimeError(f"get {res['id']} failed with {sc}: {handle}")
+            return handle
+
+    async def rewrite(sem, pool, handle):
+        if transform is None:
+            return handle
+        loop = asyncio.get_running_loop()
+        body = await loop.run_in_executor(pool, transform_storage, handle.body, transform)
+
+        def change(h):
+            # A version conflict gives the latest page, transform it again.
+            if h.version == handle.version:
+                return (h.title, body)
+            return (h.title, transform_storage(h.body, transform))
+        async with sem:
+            (sc, res, written) = await aio.write_page(url, auth, handle, change, cache)
+        if sc != 200:
+            raise RuntimeError(f"update {handle.title} failed with {sc}: {res}")
+        return written
+
+    async def descend(sem, pool, src_page, handle):
+        async with sem:
+            children = await aio.list_children(url, auth, src_page['id'])
+        dst_page = {'id': handle.id, 'title': handle.title}
+        res = await asyncio.gather(*[walk(sem, pool, child, dst_page, child_title(child['title']))
+                                     for child in children], return_exceptions=True)
+        for (child, r) in zip(children, res):
+            if isinstance(r, BaseException):
+                logging.error(f"clone {child['title']} failed: {r}")
+                results.append((child['id'], r))
+
+    async def walk(sem, pool, src_page, to_page, title):
+        try:
+            handle = await clone(sem, src_page, to_page, title)
+        except Exception as ex:
+            logging.error(f"clone {src_page['title']} failed: {ex}")
+            results.append((src_page['id'], ex))
+            return
+        (written, descended) = await asyncio.gather(rewrite(sem, pool, handle),
+                                                    descend(sem, pool, src_page, handle),
+                                                    return_exceptions=True)
+        if isinstance(written, BaseException):
+            logging.error(f"transform {handle.title} failed: {written}")
+        results.append((src_page['id'], written))
+        if isinstance(descended, BaseException):
+            # the page is cloned but its descendants are not.
+            logging.error(f"listing children of {src_page['title']} failed: {descended}")
+            results.append((src_page['id'], descended))
+
+    async def run():
+        sem = asyncio.Semaphore(jobs)
+        with ProcessPoolExecutor(workers) as pool:
+            await walk(sem, pool, src_root, parent, root_title)
+
+    aio.run(run(), jobs)
+    return results
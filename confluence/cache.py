@@ -0,0 +1,149 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+# Children listings are considered fresh for a day by default.
+# The daily hierarchy barely changes and write operations done through
+# confluence.api keep the cache up to date anyway.
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class PageTreeCache:
+    # On-disk cache of page id -> children listing.
+    # A cache file belongs to one space and its homepage. If the file was
+    # written for another space or homepage, it is ignored.
+
+    def __init__(self, path, space_id, homepage_id, ttl=DEFAULT_TTL):
+        self.path = path
+        self.key = f"{space_id}:{homepage_id}"
+        self.ttl = ttl
+        self.pages = {}
+        self.dirty = False
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                dic = json.load(f)
+        except (OSError, ValueError) as ex:
+            logging.info(f"ignore broken page tree cache {self.path}: {ex}")
+            return
+        if dic.get('key') == self.key:
+            self.pages = dic.get('pages', {})
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({'key': self.key, 'pages': self.pages}, f)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def get(self, page_id) -> Optional[list]:
+        entry = self.pages.get(str(page_id))
+        if entry is None:
+            return None
+        if time.time() - entry['time'] > self.ttl:
+            return None
+        return entry['children']
+
+    def put(self, page_id, children):
+        self.pages[str(page_id)] = {'time': time.time(), 'children': children}
+        self.dirty = True
+
+    def invalidate(self, page_id=None):
+        # Drop the listing of page_id, or everything if page_id is None.
+        if page_id is None:
+            self.pages = {}
+        else:
+            self.pages.pop(str(page_id), None)
+        self.dirty = True
+
+    def update_page(self, page):
+        # Reflect a written page (e.g. renamed) in the listings it appears in.
+        for entry in self.pages.values():
+            for (i, child) in enumerate(entry['children']):
+                if str(child.get('id')) == str(page['id']):
+                    entry['children'][i] = {**child, 'title': page['title']}
+                    self.dirty = True
+
+
+class PageBodyCache:
+    # Content addressed on-disk cache of page bodies.
+    # A page is looked up by page id, version number and body format. The
+    # body itself is stored once per content under objects/ and the rest of
+    # the page is kept in index.json.
+    # The index is only written by save(), call it once the pages are stored.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self.index = {}
+        self.dirty = False
+        # pages can be downloaded from several threads at once.
+        self.lock = threading.Lock()
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError) as ex:
+                logging.info(f"ignore broken page body cache {self.index_path}: {ex}")
+
+    def object_path(self, digest) -> str:
+        return os.path.join(self.directory, "objects", digest)
+
+    def get(self, page_id, version, body_format) -> Optional[dict]:
+        with self.lock:
+            entry = self.index.get(f"{page_id}:{version}:{body_format}")
+        if entry is None:
+            return None
+        try:
+            with open(self.object_path(entry['digest']), "r", encoding="utf-8") as f:
+                value = f.read()
+        except OSError:
+            return None
+        page = copy.deepcopy(entry['page'])
+        page['body'][body_format]['value'] = value
+        return page
+
+    def put(self, page, body_format):
+        value = page['body'][body_format]['value']
+        digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            # Several threads can store the same body at once, each of them
+            # writes its own temporary file. The object is the same whichever
+            # replace wins.
+            (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(value)
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        meta = copy.deepcopy(page)
+        meta['body'][body_format]['value'] = None
+        with self.lock:
+            self.index[f"{page['id']}:{page['version']['number']}:{body_format}"] = {'digest': digest, 'page': meta}
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = f"{self.index_path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.index, f)
+            os.replace(tmp, self.index_path)
+            self.dirty = False
@@ -40,12 +40,19 @@ class Ord(Enum):
     GT = 1
 
 
+# Category of each tag. A tag not listed here is Subordinate.
+TAG_CATEGORY = {
+    "h1": Independent(),
+    "h2": DependOn(["h1"]),
+    "h3": DependOn(["h1", "h2"]),
+}
+SUBORDINATE = Subordinate()
+
+
 def get_tag_category(curr_tag) -> TagCategory:
-    dependency = [("h1", Independent()), ("h2", DependOn(["h1"])), ("h3", DependOn(["h1", "h2"]))]
-    for (t, tg) in dependency:
-        if curr_tag == t:
-            return tg
-    return Subordinate()
+    if isinstance(curr_tag, str):
+        return TAG_CATEGORY.get(curr_tag, SUBORDINATE)
+    return SUBORDINATE
 
 
 def analize_parse_error(re_list, msg, data) -> str:
@@ -103,8 +110,10 @@ def create_body(body, root, dic) -> dict:
 # EQ : left ~ right
 # GT : left > right
 def compare(ltag, rtag) -> Ord:
-    l = get_tag_category(ltag)
-    r = get_tag_category(rtag)
+    return compare_category(get_tag_category(ltag), get_tag_category(rtag))
+
+
+def compare_category(l, r) -> Ord:
     match (l, r):
         case (Independent(), Independent()):
             return Ord.GT
@@ -131,30 +140,68 @@ def compare(ltag, rtag) -> Ord:
             return Ord.EQ
 
 
+# Elements are grouped as they are, not copied. Copy the input yourself
+# if it has to stay intact, since daily_job() modifies the groups.
 def grouping(lst) -> list[dict]:
-    if len(lst) == 0:
-        return []
-    ls = copy.deepcopy(lst)
-    curr = ls[0]
-    rest = ls[1:]
-    res = []
+    return list(iter_groups(lst))
+
+
+# Single pass version of grouping() which takes any iterable of elements
+# and yields each group as soon as the element starting the next one is seen.
+def iter_groups(elements):
+    elements = iter(elements)
+    curr = next(elements, None)
+    if curr is None:
+        return
+    # The order only depends on the pair of tags.
+    orders = {}
     tmp = [curr]
-    for elem in rest:
-        match compare(elem.tag, curr.tag):
-            case Ord.GT:
-                # elem superseeds the current group tag
-                res.append(tmp)
-                tmp = [elem]
-                curr = elem
-            case _:
-                tmp.append(elem)
-    res.append(tmp)
-    return res
+    for elem in elements:
+        key = (elem.tag, curr.tag)
+        order = orders.get(key)
+        if order is None:
+            order = compare(elem.tag, curr.tag)
+            orders[key] = order
+        if order == Ord.GT:
+            # elem superseeds the current group tag
+            yield tmp
+            tmp = [elem]
+            curr = elem
+        else:
+            tmp.append(elem)
+    yield tmp
+
+
+def shallow_copy(elem) -> ET.Element:
+    # New element whose children are shared with elem.
+    new = copy.copy(elem)
+    new.attrib = dict(elem.attrib)
+    return new
+
+
+# Elements can appear more than once in a tree after daily_job(), since
+# a duplicated group shares its elements. Replace the later appearances
+# by copies before modifying the tree in place.
+def unshare(root) -> ET.Element:
+    seen = set()
+
+    def walk(elem):
+        for (i, child) in enumerate(elem):
+            if id(child) in seen:
+                child = copy.deepcopy(child)
+                elem[i] = child
+            seen.add(id(child))
+            walk(child)
+
+    walk(root)
+    return root
 
 
 # remove first h? tag group
 # duplicate second h? group
 # Keep non h? group as it is.
+# The duplicated group shares everything but its heading with the
+# original one, see unshare().
 def daily_job(lss) -> list[dict]:
     res = list()
     count = 0
@@ -170,12 +217,15 @@ def daily_job(lss) -> list[dict]:
                 if count == 1:
                     previous_text = ls[0].text
                 elif count == 2:
-                    # duplicate this group
-                    ls2 = copy.deepcopy(ls)
-                    res.append(ls)
+                    # duplicate this group, only the heading is copied
+                    # since it is the only element to be changed.
                     if previous_text != "":
-                        ls[0].text = previous_text
-                    res.append(ls2)
+                        heading = shallow_copy(ls[0])
+                        heading.text = previous_text
+                        res.append([heading] + ls[1:])
+                    else:
+                        res.append(ls)
+                    res.append(ls)
                 else:
                     res.append(ls)
             case Subordinate():
@@ -185,11 +235,67 @@ def daily_job(lss) -> list[dict]:
 
 def update_tree(etree) -> ET.Element:
     root = ET.Element("root")
-    lst = []
-    for e in etree:
-        lst.append(e)
-    grouped = grouping(lst)
+    grouped = iter_groups(etree)
     updated = daily_job(grouped)
     for e in [item for agroup in updated for item in agroup]:
         root.append(e)
     return root
+
+
+# Streaming version of daily_job(iter_groups(elements)).
+# Elements are taken one by one and serialized by serialize() as soon as
+# their group is known, only the original of the duplicated group is
+# held (serialized) until the group ends.
+def stream_daily_job(elements, serialize):
+    count = 0
+    previous_text = ""
+    curr = None
+    action = None
+    second = []
+    orders = {}
+    for elem in elements:
+        if curr is None:
+            order = Ord.GT
+        else:
+            key = (elem.tag, curr.tag)
+            order = orders.get(key)
+            if order is None:
+                order = compare(elem.tag, curr.tag)
+                orders[key] = order
+        if order == Ord.GT:
+            # elem starts a new group
+            yield from second
+            second = []
+            curr = elem
+            match get_tag_category(elem.tag):
+                case Independent() | DependOn(_):
+                    count = count + 1
+                    if count == 1:
+                        previous_text = elem.text
+                        action = "drop"
+                    elif count == 2:
+                        action = "dup"
+                    else:
+                        action = "emit"
+                case Subordinate():
+                    action = "emit"
+            if action == "dup":
+                serialized = serialize(elem)
+                second.append(serialized)
+                if previous_text != "":
+                    heading = shallow_copy(elem)
+                    heading.text = previous_text
+                    yield serialize(heading)
+                else:
+                    yield serialized
+                continue
+        match action:
+            case "emit":
+                yield serialize(elem)
+            case "dup":
+                serialized = serialize(elem)
+                second.append(serialized)
+                yield serialized
+            case _:
+                pass
+    yield from second
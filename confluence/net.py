@@ -1,8 +1,180 @@
+import codecs
+import contextlib
 import copy
+import itertools
 import json
 import re
 import urllib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 import requests
+from requests.adapters import HTTPAdapter
+
+from confluence.scheduler import Scheduler
+
+# Number of per-host connection pools kept by the shared session and
+# the number of keep-alive connections kept in each of them.
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+_session = None
+_scheduler = None
+
+
+def create_session(pool_connections=DEFAULT_POOL_CONNECTIONS,
+                   pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                   pool_block=False,
+                   adapter=None) -> requests.Session:
+    # pool_maxsize is a per-host limit. If pool_block is True, a request
+    # waits for a free connection instead of opening an extra one.
+    # A custom transport adapter can be given and it is mounted for both
+    # http and https.
+    if adapter is None:
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              pool_block=pool_block)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        _session = create_session()
+    return _session
+
+
+def set_session(session) -> Optional[requests.Session]:
+    # Replace the shared session and returns the previous one.
+    # None drops the current session and a fresh one is created on demand.
+    global _session
+    prev = _session
+    _session = session
+    return prev
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
+
+
+def set_scheduler(scheduler) -> Optional[Scheduler]:
+    # Replace the shared scheduler and returns the previous one.
+    global _scheduler
+    prev = _scheduler
+    _scheduler = scheduler
+    return prev
+
+
+def send(method, url, **kwargs) -> requests.Response:
+    return get_session().request(method, url, **kwargs)
+
+
+def request(method, url, **kwargs) -> requests.Response:
+    # Every request in this module goes through the shared scheduler and
+    # session, so that rate limit and retries apply to all the calls and
+    # TCP/TLS connections are reused across calls.
+    return get_scheduler().request(send, method, url, **kwargs)
+
+
+# Size of a chunk read from a streamed response body.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WS = re.compile(r"\s*")
+
+
+def decode_json(response):
+    # Decode straight from the raw bytes. response.text would build another
+    # copy of the body as str (and may guess its encoding over the whole body).
+    return json.loads(response.content)
+
+
+def iter_json_items(chunks, key):
+    # Yield the items of the array stored under key of the top level JSON
+    # object while the bytes in chunks are still arriving.
+    # Only the item being decoded is kept in memory, other members of the
+    # object are decoded and dropped.
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    eof = False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        buf = buf[pos:]
+        pos = 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buf += utf8.decode(b"", final=True)
+        else:
+            buf += utf8.decode(chunk)
+        return True
+
+    def peek() -> str:
+        nonlocal pos
+        while True:
+            pos = _WS.match(buf, pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                raise json.JSONDecodeError("Unexpected end of data", buf, pos)
+
+    def value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                (obj, end) = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # the value may continue in the next chunk
+                if not more():
+                    raise
+                continue
+            # a number at the end of buf may continue in the next chunk
+            if end == len(buf) and more():
+                continue
+            pos = end
+            return obj
+
+    def expect(c):
+        nonlocal pos
+        if peek() != c:
+            raise json.JSONDecodeError(f"Expecting '{c}'", buf, pos)
+        pos += 1
+
+    expect('{')
+    while True:
+        c = peek()
+        if c == '}':
+            return
+        if c == ',':
+            pos += 1
+            continue
+        name = value()
+        expect(':')
+        if name != key:
+            value()
+            continue
+        expect('[')
+        while True:
+            c = peek()
+            if c == ']':
+                pos += 1
+                break
+            if c == ',':
+                pos += 1
+                continue
+            yield value()
 
 
 def merge_results(res) -> dict:
@@ -33,7 +205,7 @@ def get(url, auth, extra = {}) -> (int, dict):
     }
     query_param = format_query_parameter(extra)
     request_url = f"{url}{query_param}"
-    response = requests.request(
+    response = request(
         "GET",
         request_url,
         headers=headers,
@@ -53,24 +225,88 @@ def multi_get(url, auth, limit, extra = {}) -> (int, dict):
         extra['start'] = start
         query_param = format_query_parameter(extra)
         request_url = f"{url}{query_param}"
-        response = requests.request(
+        response = request(
             "GET",
             request_url,
             headers=headers,
             auth=auth
         )
         if response.status_code == 200:
-            resp = json.loads(response.text)
+            resp = decode_json(response)
             size = resp['size']
             if size == 0:
                 break
             start = start + size
             res.append(resp)
         else:
-            return (response.status_code, json.loads(response.text))
+            return (response.status_code, decode_json(response))
     return (200, merge_results(res))
 
 
+def get_v1_page(url, auth, limit, extra, start) -> requests.Response:
+    headers = {
+        "Accept": "application/json"
+    }
+    extra2 = copy.copy(extra)
+    extra2['limit'] = limit
+    extra2['start'] = start
+    query_param = format_query_parameter(extra2)
+    request_url = f"{url}{query_param}"
+    return request(
+        "GET",
+        request_url,
+        headers=headers,
+        auth=auth
+    )
+
+
+def iter_get(url, auth, limit, extra = {}, parallel = 4):
+    # Streaming and parallel version of multi_get().
+    # The first response tells the page size the server actually uses.
+    # If the total size is reported, all the remaining offset windows are
+    # submitted at once and run `parallel` at a time. Otherwise up to `parallel` windows ahead are kept
+    # in flight until a short page shows the end of the collection.
+    # Results are yielded in offset order. A non 200 response raises
+    # requests.HTTPError.
+    assert parallel > 0
+
+    def fetch(start):
+        response = get_v1_page(url, auth, limit, extra, start)
+        if response.status_code != 200:
+            raise requests.HTTPError(f"{response.status_code} for {response.url}", response=response)
+        return decode_json(response)
+
+    resp = fetch(0)
+    yield from resp['results']
+    step = resp.get('limit', limit)
+    if resp['size'] == 0 or resp['size'] < step:
+        return
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        if 'totalSize' in resp:
+            # every window is known, the executor runs parallel of them at once.
+            offsets = iter(range(step, resp['totalSize'], step))
+            window = None
+        else:
+            offsets = itertools.count(step, step)
+            window = parallel
+        pending = deque()
+        for start in itertools.islice(offsets, window):
+            pending.append(executor.submit(fetch, start))
+        try:
+            while pending:
+                resp = pending.popleft().result()
+                yield from resp['results']
+                if resp['size'] < step:
+                    break
+                start = next(offsets, None)
+                if start is not None:
+                    pending.append(executor.submit(fetch, start))
+        finally:
+            for future in pending:
+                future.cancel()
+
+
 def parse_link_header(header):
     if header is None:
         return None
@@ -87,43 +323,74 @@ def parse_link_header(header):
         return None
 
 
-def multi_get_v2(url, auth, limit, extra = {}) -> (int, dict):
+def get_v2_page(url, auth, limit, extra, next_link, stream=False) -> requests.Response:
     headers = {
         "Accept": "application/json"
     }
+    extra2 = copy.copy(extra)
+    extra2['limit'] = limit
+    if next_link:
+        extra2['next'] = next_link
+    query_param = format_query_parameter(extra2) # instead of extra
+    request_url = f"{url}{query_param}"
+
+    return request(
+        "GET",
+        request_url,
+        headers=headers,
+        auth=auth,
+        stream=stream
+    )
+
+
+def multi_get_v2(url, auth, limit, extra = {}) -> (int, dict):
     res = []
     next_link = None
     while True:
-        extra2 = copy.copy(extra)
-        extra2['limit'] = limit
-        if next_link:
-            extra2['next'] = next_link
-        query_param = format_query_parameter(extra2) # instead of extra
-        request_url = f"{url}{query_param}"
-
-        response = requests.request(
-            "GET",
-            request_url,
-            headers=headers,
-            auth=auth
-        )
+        response = get_v2_page(url, auth, limit, extra, next_link)
         if response.status_code == 200:
-            resp = json.loads(response.text)
+            resp = decode_json(response)
             res.append(resp)
             next_link = parse_link_header(response.headers.get("link"))
             if next_link is None:
                 break
         else:
-            return (response.status_code, json.loads(response.text))
+            return (response.status_code, decode_json(response))
     return (200, merge_results_v2(res))
 
 
+def iter_get_v2(url, auth, limit, extra = {}):
+    # Streaming version of multi_get_v2().
+    # Yields each result as soon as its page arrives. The next page is
+    # requested in the background while the caller consumes the current one.
+    # A non 200 response raises requests.HTTPError.
+    # The body is decoded while it is downloaded, so only a few results
+    # are held in memory at a time.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(get_v2_page, url, auth, limit, extra, None, True)
+        try:
+            while future is not None:
+                response = future.result()
+                future = None
+                with contextlib.closing(response):
+                    if response.status_code != 200:
+                        raise requests.HTTPError(f"{response.status_code} for {response.url}", response=response)
+                    next_link = parse_link_header(response.headers.get("link"))
+                    if next_link is not None:
+                        future = executor.submit(get_v2_page, url, auth, limit, extra, next_link, True)
+                    yield from iter_json_items(response.iter_content(STREAM_CHUNK_SIZE), 'results')
+        finally:
+            # the caller stopped early, release the prefetched connection.
+            if future is not None and future.exception() is None:
+                future.result().close()
+
+
 def post(url, auth, payload) -> (int, dict):
     post_headers = {
         "Accept": "application/json",
         "Content-Type": "application/json"
     }
-    response = requests.request(
+    response = request(
         "POST",
         url,
         data=payload,
@@ -138,7 +405,7 @@ def put(url, auth, payload) -> (int, dict):
         "Accept": "application/json",
         "Content-Type": "application/json"
     }
-    response = requests.request(
+    response = request(
         "PUT",
         url,
         data=payload,
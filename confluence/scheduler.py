@@ -0,0 +1,163 @@
+import datetime
+import email.utils
+import logging
+import random
+import re
+import threading
+import time
+from typing import Optional
+
+# Responses that are worth sending the request again.
+RETRY_STATUS = (429, 503)
+# 429 means the request was rejected before it was processed, so only it
+# is safe to send again for POST and PUT. A 503 can come from a gateway
+# after the server handled the request, e.g. created or updated a page.
+WRITE_RETRY_STATUS = (429,)
+
+
+def parse_retry_after(value, now=None) -> Optional[float]:
+    # Retry-After is either seconds or an HTTP date.
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+
+def endpoint_key(method, url) -> str:
+    # Page ids and other numbers in the path are folded so that
+    # e.g. every GET /pages/{id} shares one concurrency cap.
+    path = re.sub(r"^[a-z]+://[^/]*", "", url).split('?')[0]
+    return f"{method} {re.sub('/[0-9]+', '/{id}', path)}"
+
+
+class TokenBucket:
+    # rate tokens are added per second up to burst tokens.
+    # rate None means no limit.
+
+    def __init__(self, rate=None, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        # Stop handing out tokens for seconds, e.g. after Retry-After.
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class Scheduler:
+    # Sends requests with a token bucket rate limit, a concurrency cap per
+    # endpoint and retries of 429/503 and connection errors.
+    # The wait before a retry is Retry-After if the server gives it,
+    # otherwise exponential backoff with full jitter.
+    # The endpoint slot of a stream=True request is held until the caller
+    # closes the response, so that the body download counts against the cap.
+
+    def __init__(self, rate=None, burst=1, max_retries=5, backoff=0.5, max_backoff=60.0,
+                 endpoint_limit=None, clock=time.monotonic, sleep=time.sleep):
+        self.bucket = TokenBucket(rate, burst, clock, sleep)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.endpoint_limit = endpoint_limit
+        self.sleep = sleep
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def semaphore(self, key) -> Optional[threading.Semaphore]:
+        if self.endpoint_limit is None:
+            return None
+        with self.lock:
+            if key not in self.semaphores:
+                self.semaphores[key] = threading.BoundedSemaphore(self.endpoint_limit)
+            return self.semaphores[key]
+
+    def backoff_time(self, attempt) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def retry_status(self, method) -> tuple:
+        return WRITE_RETRY_STATUS if method in ("POST", "PUT") else RETRY_STATUS
+
+    def request(self, send, method, url, **kwargs):
+        sem = self.semaphore(endpoint_key(method, url))
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            if sem is not None:
+                sem.acquire()
+            release = sem is not None
+            try:
+                response = send(method, url, **kwargs)
+            except OSError as ex:
+                # requests.RequestException is an OSError.
+                # Only idempotent requests are sent again, since we don't
+                # know whether the server processed it.
+                if method == "POST" or attempt >= self.max_retries:
+                    raise
+                wait = self.backoff_time(attempt)
+                logging.info(f"{method} {url} failed with {ex}, retry in {wait:.1f}s")
+            else:
+                if response.status_code not in self.retry_status(method) or attempt >= self.max_retries:
+                    if release and kwargs.get('stream'):
+                        hold_until_closed(response, sem)
+                        release = False
+                    return response
+                # give the connection back to the pool before waiting.
+                response.close()
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is None:
+                    wait = self.backoff_time(attempt)
+                else:
+                    wait = min(retry_after, self.max_backoff)
+                    # every request has to wait, not only this one.
+                    self.bucket.pause(wait)
+                logging.info(f"{method} {url} got {response.status_code}, retry in {wait:.1f}s")
+            finally:
+                if release:
+                    sem.release()
+            attempt += 1
+            self.sleep(wait)
+
+
+def hold_until_closed(response, sem):
+    # Release sem when response is closed, once.
+    close = response.close
+    released = threading.Event()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released.is_set():
+                released.set()
+                sem.release()
+    response.close = close_and_release
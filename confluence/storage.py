@@ -0,0 +1,141 @@
+import io
+import logging
+from xml.etree import ElementTree as ET
+from xml.etree.ElementTree import ParseError
+
+from confluence.content import analize_parse_error, unbound_prefix_report, stream_daily_job
+
+# As ElementTree doesn't allow us to use undefined xmlns,
+# dummy name spaces are declared for the prefixes used in storage format.
+DEFAULT_NAMESPACES = {"ac": "https://example.com/ac", "ri": "http://example.com/ri"}
+
+
+class StorageCodec:
+    # Parses a storage format body into a tree under a fake root and
+    # serializes the content of the root back.
+    # The fake document is never built as one string: the prefix, the body
+    # and the suffix are fed to the parser one after another.
+    # Name spaces are registered when the codec is created and again before
+    # each serialization, since the prefix registry of ElementTree is global
+    # and someone else may have bound our prefixes to another uri since.
+
+    def __init__(self, namespaces=DEFAULT_NAMESPACES):
+        self.namespaces = dict(namespaces)
+        self.register()
+        xmlns = " ".join(f'xmlns:{ns}="{uri}"' for (ns, uri) in self.namespaces.items())
+        self.prefix = f'<!DOCTYPE html [<!ENTITY nbsp "&#160;">]><root {xmlns}>'
+        self.suffix = "</root>"
+
+    def register(self):
+        for (ns, uri) in self.namespaces.items():
+            ET.register_namespace(ns, uri)
+
+    def parse(self, value) -> ET.Element:
+        parser = ET.XMLParser()
+        try:
+            parser.feed(self.prefix)
+            parser.feed(value)
+            parser.feed(self.suffix)
+            return parser.close()
+        except ParseError as ex:
+            # only on error, build the whole document to show where it is.
+            hint = analize_parse_error(
+                [("unbound prefix: line ([0-9]+), column ([0-9]+)", unbound_prefix_report)],
+                ex.msg, f"{self.prefix}{value}{self.suffix}")
+            logging.error(f"XML parse error near {hint}\n{ex.msg}")
+            raise
+
+    def serialize(self, root) -> str:
+        # Write the tree to a buffer, then drop the start and end tags of the
+        # fake root with the name space declarations on it.
+        self.register()
+        buf = _InnerWriter()
+        ET.ElementTree(root).write(buf, encoding="unicode")
+        return buf.getvalue()
+
+    def serialize_element(self, elem) -> str:
+        # elem and its tail, as a part of a body.
+        holder = ET.Element("root")
+        holder.append(elem)
+        return self.serialize(holder)
+
+    def iter_top_level(self, chunks):
+        # Yield the top level elements of a body given as chunks of str, as
+        # soon as each is complete. An element is yielded when the next one
+        # starts, since only then its tail is known. Yielded elements are
+        # detached from the root so that the parsed tree doesn't grow.
+        parser = ET.XMLPullParser(events=("start", "end"))
+        parser.feed(self.prefix)
+        root = None
+        pending = None
+        depth = 0
+
+        def drain():
+            nonlocal root, pending, depth
+            for (event, elem) in parser.read_events():
+                if event == "start":
+                    depth += 1
+                    if root is None:
+                        root = elem
+                    elif depth == 2 and pending is not None:
+                        root.remove(pending)
+                        yield pending
+                        pending = None
+                else:
+                    depth -= 1
+                    if depth == 1:
+                        pending = elem
+                    elif depth == 0 and pending is not None:
+                        root.remove(pending)
+                        yield pending
+                        pending = None
+
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from drain()
+        parser.feed(self.suffix)
+        parser.close()
+        yield from drain()
+
+
+def stream_update_tree(chunks, codec=None):
+    # Streaming version of update_tree(). Takes a storage format body as
+    # chunks of str and yields the transformed body in pieces, holding only
+    # the current element (and the duplicated group) in memory.
+    if codec is None:
+        codec = default_codec
+    return stream_daily_job(codec.iter_top_level(chunks), codec.serialize_element)
+
+
+class _InnerWriter:
+    # Text file like object that skips everything up to the end of the first
+    # start tag. ElementTree escapes '>' in attribute values, so the first
+    # '>' closes the root start tag.
+
+    def __init__(self):
+        self.buf = io.StringIO()
+        self.in_root_tag = True
+        self.empty = False
+        self.last = 0
+
+    def write(self, s):
+        if self.in_root_tag:
+            pos = s.find('>')
+            if pos < 0:
+                return len(s)
+            self.in_root_tag = False
+            self.empty = pos > 0 and s[pos - 1] == '/'
+            s = s[pos + 1:]
+        self.last = self.buf.tell()
+        return self.buf.write(s)
+
+    def getvalue(self) -> str:
+        if self.empty:
+            return ""
+        # the end tag of the root is the last thing written.
+        self.buf.seek(self.last)
+        self.buf.truncate()
+        return self.buf.getvalue()
+
+
+default_codec = StorageCodec()
@@ -0,0 +1,146 @@
+import logging
+import os
+import sqlite3
+from typing import Optional
+
+import confluence.aio as aio
+from confluence.net import iter_get_v2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    title TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_parent ON pages (parent_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class Mirror:
+    # Local copy of the page tree of a space.
+    # Page metadata is kept in mirror.db (SQLite) and each body in
+    # bodies/<page id>.<body format>.
+    # Mirror can be given as the cache of get_children()/find_page_by_path()
+    # to resolve paths without asking the server.
+
+    def __init__(self, directory, body_format='storage'):
+        self.directory = directory
+        self.body_format = body_format
+        os.makedirs(os.path.join(directory, "bodies"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "mirror.db"))
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def body_path(self, page_id) -> str:
+        return os.path.join(self.directory, "bodies", f"{page_id}.{self.body_format}")
+
+    def set_meta(self, key, value):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def get_meta(self, key) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def versions(self) -> dict:
+        return dict(self.db.execute("SELECT id, version FROM pages"))
+
+    def store(self, page, parent_id):
+        tmp = f"{self.body_path(page['id'])}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(page['body'][self.body_format]['value'])
+        os.replace(tmp, self.body_path(page['id']))
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO pages (id, parent_id, title, version) VALUES (?, ?, ?, ?)",
+                            (str(page['id']), parent_id, page['title'], page['version']['number']))
+
+    def move(self, page_id, parent_id, title):
+        # Title and parent can change without a new version, e.g. by a move.
+        with self.db:
+            self.db.execute("UPDATE pages SET parent_id = ?, title = ? WHERE id = ?",
+                            (parent_id, title, str(page_id)))
+
+    def remove(self, page_id):
+        with self.db:
+            self.db.execute("DELETE FROM pages WHERE id = ?", (str(page_id),))
+        if os.path.exists(self.body_path(page_id)):
+            os.remove(self.body_path(page_id))
+
+    def body(self, page_id) -> Optional[str]:
+        try:
+            with open(self.body_path(page_id), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def get(self, page_id) -> list:
+        # Children of page_id in the same shape as get_children() returns.
+        rows = self.db.execute("SELECT id, title FROM pages WHERE parent_id = ? ORDER BY rowid",
+                               (str(page_id),))
+        return [{'id': page_id, 'title': title} for (page_id, title) in rows]
+
+    def put(self, page_id, children):
+        # The mirror is only updated by sync_space().
+        pass
+
+
+def list_space_pages(url, auth, space_id):
+    # Every page of the space with its parent and version, without bodies.
+    space_pages_url = f"{url}/wiki/api/v2/spaces/{space_id}/pages?"
+    return iter_get_v2(space_pages_url, auth, 250)
+
+
+def sync_space(url, auth, space, mirror, jobs=4) -> (list, list):
+    # Bring mirror up to date with the space.
+    # Only the bodies of pages whose version differs from the mirror are
+    # downloaded. Pages that disappeared from the space are removed.
+    # Returns (ids of fetched pages, ids of removed pages). Raises the first
+    # download failure after the other pages are stored.
+    mirror.set_meta("space_id", space['id'])
+    mirror.set_meta("homepage_id", space['homepageId'])
+    local = mirror.versions()
+    remote = {}
+    changed = []
+    for page in list_space_pages(url, auth, space['id']):
+        page_id = str(page['id'])
+        parent_id = None if page.get('parentId') is None else str(page['parentId'])
+        remote[page_id] = page
+        if local.get(page_id) != page['version']['number']:
+            changed.append((page_id, parent_id))
+        else:
+            mirror.move(page_id, parent_id, page['title'])
+
+    async def fetch(page_id, parent_id):
+        (sc, page) = await aio.get_page_by_id(url, auth, page_id, mirror.body_format)
+        if sc != 200:
+            raise RuntimeError(f"get_page_by_id({page_id}) failed with {sc}")
+        # Stored right away so that only jobs bodies are held at once and
+        # an interrupted sync keeps what it already fetched.
+        mirror.store(page, parent_id)
+        return page_id
+
+    async def run():
+        return await aio.gather_limited([fetch(page_id, parent_id) for (page_id, parent_id) in changed], jobs)
+
+    fetched = []
+    errors = []
+    for ((page_id, _), r) in zip(changed, aio.run(run(), jobs)):
+        if isinstance(r, BaseException):
+            logging.error(f"sync {page_id} failed: {r}")
+            errors.append(r)
+        else:
+            fetched.append(page_id)
+
+    removed = [page_id for page_id in local if page_id not in remote]
+    for page_id in removed:
+        mirror.remove(page_id)
+    if errors:
+        raise errors[0]
+    return (fetched, removed)
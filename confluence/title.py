@@ -0,0 +1,93 @@
+import datetime
+import functools
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# Regular expressions that accept at least what strptime() accepts for
+# each directive. They are only used to reject titles quickly, strptime()
+# still decides whether a title really matches.
+_NUMBER = r" ?\d+"
+_DIRECTIVE_RE = {
+    'Y': r"\d{4}",
+    'G': r"\d{4}",
+    'f': r"\d{1,6}",
+    'd': _NUMBER, 'm': _NUMBER, 'y': _NUMBER, 'H': _NUMBER, 'I': _NUMBER,
+    'M': _NUMBER, 'S': _NUMBER, 'j': _NUMBER, 'U': _NUMBER, 'W': _NUMBER,
+    'V': _NUMBER, 'u': _NUMBER, 'w': _NUMBER,
+    '%': "%",
+}
+
+
+@dataclass(frozen=True)
+class TitleMatcher:
+    fmt: str
+    # literal text in front of the first directive, lower cased.
+    prefix: str
+    regex: re.Pattern
+    # True if fmt has no directive. strptime() still accepts titles that
+    # differ in case or white spaces then.
+    literal: bool
+
+    def match(self, title) -> (Optional[str], datetime.datetime):
+        if title == self.fmt:
+            # Exact same title gets maximum priority.
+            return (title, datetime.datetime.max)
+        if title[:len(self.prefix)].lower() != self.prefix:
+            return (None, datetime.datetime.min)
+        if self.regex.fullmatch(title) is None:
+            return (None, datetime.datetime.min)
+        try:
+            return (title, datetime.datetime.strptime(title, self.fmt))
+        except ValueError:
+            # error case means title does not match agaisnt fmt
+            # it means, title get least priority
+            return (None, datetime.datetime.min)
+
+    def rank(self, pages) -> list[tuple[datetime.datetime, dict]]:
+        # Match all the pages in one pass and return (datetime, page) of
+        # the matched ones, the highest priority first.
+        # Pages with the same priority keep their order.
+        ranked = []
+        for page in pages:
+            (matched, dt) = self.match(page['title'])
+            if matched is not None:
+                ranked.append((dt, page))
+        ranked.sort(key=lambda r: r[0], reverse=True)
+        return ranked
+
+
+def translate_format(fmt) -> (str, bool):
+    # Returns the regular expression for fmt and whether fmt has a directive.
+    pat = []
+    has_directive = False
+    i = 0
+    while i < len(fmt):
+        c = fmt[i]
+        if c == '%' and i + 1 < len(fmt):
+            d = fmt[i + 1]
+            if d != '%':
+                has_directive = True
+            pat.append(_DIRECTIVE_RE.get(d, ".*?"))
+            i += 2
+        elif c.isspace():
+            # strptime() turns a run of white spaces into one \s+.
+            while i < len(fmt) and fmt[i].isspace():
+                i += 1
+            pat.append(r"\s+")
+        else:
+            pat.append(re.escape(c))
+            i += 1
+    return ("".join(pat), has_directive)
+
+
+def literal_prefix(fmt) -> str:
+    prefix = re.match(r"[^%\s]*", fmt).group(0)
+    # lower() could change the length of non ascii text.
+    return prefix.lower() if prefix.isascii() else ""
+
+
+@functools.lru_cache(maxsize=256)
+def compile_title_format(fmt) -> TitleMatcher:
+    (pat, has_directive) = translate_format(fmt)
+    return TitleMatcher(fmt, literal_prefix(fmt), re.compile(pat, re.IGNORECASE), not has_directive)
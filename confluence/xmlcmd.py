@@ -1,9 +1,11 @@
 import copy
 from collections import deque
-from dataclasses import dataclass
-from xml.etree import ElementPath as EP
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from xml.etree import ElementTree as ET
 
+from confluence.storage import default_codec
+
 
 @dataclass
 class GetXPath:
@@ -64,71 +66,171 @@ class Null:
 Data = Node | Null
 
 
-def interp(cmd_stack: deque, data_stack) -> Data:
-    if len(cmd_stack) == 0:
-        return data_stack
-    curr_cmd = cmd_stack.popleft()
+def compile_xpath(xp):
+    # Bind xp into a function that works as elem.find(xp).
+    # The path is checked here so that a bad program fails when it is
+    # compiled, not in the middle of a document. Only the public find() is
+    # used, ElementPath keeps the parsed selector in its own cache.
+    ET.Element("root").find(xp)
+
+    def find(elem):
+        return elem.find(xp)
+    return find
 
-    match curr_cmd:
-        case GetXPath(xp):
-            assert len(data_stack) > 0
-            node = data_stack[0]
-            match node:
-                case Node(elm):
-                    r = EP.find(elm, xp)
-                    if r is None:
-                        data_stack.appendleft(Null())
-                    else:
-                        data_stack.appendleft(Node(r))
-                case _:
-                    raise Exception("Invalid node")
 
+def compile_cmd(cmd):
+    # Bind cmd to a function which takes the data stack.
+    match cmd:
+        case GetXPath(xp):
+            find = compile_xpath(xp)
+
+            def op(data_stack):
+                assert len(data_stack) > 0
+                node = data_stack[0]
+                match node:
+                    case Node(elm):
+                        r = find(elm)
+                        if r is None:
+                            data_stack.appendleft(Null())
+                        else:
+                            data_stack.appendleft(Node(r))
+                    case _:
+                        raise Exception("Invalid node")
         case Copy():
-            assert len(data_stack) > 0
-            org_node = data_stack.popleft()
-            new_node = copy.deepcopy(org_node)
-            data_stack.appendleft(new_node)
+            def op(data_stack):
+                assert len(data_stack) > 0
+                org_node = data_stack.popleft()
+                new_node = copy.deepcopy(org_node)
+                data_stack.appendleft(new_node)
         case Dup():
-            assert len(data_stack) > 0
-            org_node = data_stack[0]
-            data_stack.appendleft(org_node)
+            def op(data_stack):
+                assert len(data_stack) > 0
+                org_node = data_stack[0]
+                data_stack.appendleft(org_node)
         case Pop():
-            assert len(data_stack) > 0
-            data_stack.popleft()
+            def op(data_stack):
+                assert len(data_stack) > 0
+                data_stack.popleft()
         case Remove():
-            assert len(data_stack) >= 2
-            node = data_stack.popleft()
-            top = data_stack[0]
-            match node, top:
-                case Node(elm), Node(root):
-                    root.remove(elm)
-                case _, _:
-                    raise Exception("Invalid Node")
+            def op(data_stack):
+                assert len(data_stack) >= 2
+                node = data_stack.popleft()
+                top = data_stack[0]
+                match node, top:
+                    case Node(elm), Node(root):
+                        root.remove(elm)
+                    case _, _:
+                        raise Exception("Invalid Node")
         case Push(elm):
-            data_stack.appendleft(Node(elm))
+            # The same element is pushed every time the program runs.
+            def op(data_stack):
+                data_stack.appendleft(Node(elm))
         case Insert(nth):
             assert nth >= 0
-            assert len(data_stack) >= 2
-            node = data_stack.popleft()
-            top = data_stack[0]
-            match node, top:
-                case Node(elm), Node(root):
-                    root.insert(nth, elm)
-                case _, _:
-                    raise Exception("Invalid Node")
+
+            def op(data_stack):
+                assert len(data_stack) >= 2
+                node = data_stack.popleft()
+                top = data_stack[0]
+                match node, top:
+                    case Node(elm), Node(root):
+                        root.insert(nth, elm)
+                    case _, _:
+                        raise Exception("Invalid Node")
         case CallFunction(func, args, conv):
             assert func is not None
-            res = func(*args)
-            if res is not None:
-                data_stack.appendleft(Node(conv(res)))
-            else:
-                data_stack.appendleft(Null)
 
-    res = interp(cmd_stack, data_stack)
-    return res
+            def op(data_stack):
+                res = func(*args)
+                if res is not None:
+                    data_stack.appendleft(Node(conv(res)))
+                else:
+                    data_stack.appendleft(Null)
+        case _:
+            def op(data_stack):
+                pass
+    return op
+
+
+@dataclass
+class Program:
+    # A command list compiled into a flat list of operations.
+    # It can be run against many roots.
+    # cmds is kept to compile the program again in worker processes, since
+    # the operations are closures and can't be pickled.
+    ops: list
+    cmds: list = field(default_factory=list)
+
+    def execute(self, data_stack) -> deque:
+        for op in self.ops:
+            op(data_stack)
+        return data_stack
+
+    def run(self, root: ET.Element) -> deque:
+        return self.execute(deque([Node(root)]))
+
+
+def compile_program(ls) -> Program:
+    cmds = list(ls)
+    return Program([compile_cmd(cmd) for cmd in cmds], cmds)
+
+
+def interp(cmd_stack: deque, data_stack) -> Data:
+    program = compile_program(cmd_stack)
+    cmd_stack.clear()
+    return program.execute(data_stack)
 
 
 def interpreter(ls: list, root: ET.Element):
-    cq = deque(ls)
-    dq = deque([Node(root)])
-    return interp(cq, dq)
+    return compile_program(ls).run(root)
+
+
+def run_document(program, doc):
+    # doc is a root element or a storage format body.
+    # A root is changed in place and the data stack is returned.
+    # A body is parsed, changed and returned serialized.
+    if isinstance(doc, str):
+        root = default_codec.parse(doc)
+        program.run(root)
+        return default_codec.serialize(root)
+    return program.run(doc)
+
+
+def run_document_safe(program, doc):
+    try:
+        return run_document(program, doc)
+    except Exception as ex:
+        return ex
+
+
+_worker_program = None
+
+
+def init_worker(cmds):
+    global _worker_program
+    _worker_program = compile_program(cmds)
+
+
+def run_in_worker(doc):
+    return run_document_safe(_worker_program, doc)
+
+
+def run_many(program, docs, mode=None, workers=None) -> list:
+    # Run one compiled program over many documents (roots or storage bodies).
+    # mode is None to run them one by one, "thread" or "process".
+    # In "process" mode the program is compiled once per worker, so its
+    # commands have to be picklable, and only storage bodies are useful
+    # since a root changed in another process isn't seen here.
+    # Returns the result of run_document() or the exception raised for
+    # each document, in docs order.
+    match mode:
+        case None:
+            return [run_document_safe(program, doc) for doc in docs]
+        case "thread":
+            with ThreadPoolExecutor(workers) as pool:
+                return list(pool.map(lambda doc: run_document_safe(program, doc), docs))
+        case "process":
+            with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(program.cmds,)) as pool:
+                return list(pool.map(run_in_worker, docs))
+        case _:
+            raise ValueError(f"unknown mode {mode}")
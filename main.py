@@ -7,10 +7,16 @@ import logging
 import json
 import pprint as pp
 
+import confluence.net
 import jsonschema.validater
-from confluence.api import get_space, get_children, rename_page, \
-    copy_page, update_page, find_page_by_path, get_page_by_id
+from confluence.api import get_space, get_children, copy_page, find_pages_by_paths, \
+    page_handle_from_v1, PagePlan, merge_plans, apply_plan
+from confluence.batch import transform_files
+from confluence.bulk import download_adf, bulk_copy, load_manifest, clone_tree
+from confluence.cache import PageTreeCache, PageBodyCache, DEFAULT_TTL
 from confluence.content import update_tree
+from confluence.scheduler import Scheduler
+from confluence.sync import Mirror, sync_space
 
 
 def parse_args():
@@ -18,6 +24,14 @@ def parse_args():
     top_parser.add_argument('--yaml', help='email and token', type=str, required=True)
     top_parser.add_argument('--log-level', default="ERROR", choices=["NOTEST", "INFO", "DEBUG", "ERROR", "CRITICAL"],
                             help="TRACE, INFO, DEBUG, ERROR, CRITICAL are available")
+    top_parser.add_argument('--pool-size', default=10, type=int,
+                            help='number of keep-alive connections kept per host, raised to --jobs if smaller')
+    top_parser.add_argument('--rate', default=None, type=float,
+                            help='maximum requests per second sent to the server')
+    top_parser.add_argument('--max-retries', default=5, type=int,
+                            help='retries of a request answered by 429 or 503')
+    top_parser.add_argument('--endpoint-limit', default=None, type=int,
+                            help='maximum concurrent requests per endpoint')
 
     cmd_parser = top_parser.add_subparsers(dest='command')
     daily_update_parser = cmd_parser.add_parser('daily-update', help='copy page on confluence')
@@ -25,15 +39,42 @@ def parse_args():
     daily_update_parser.add_argument('--from', dest='frm', help='page to be copied from', required=True)
     daily_update_parser.add_argument('--into', help='page to be copied int0', required=True)
     daily_update_parser.add_argument('--title-format', help='page title', required=True)
+    daily_update_parser.add_argument('--no-server-filter', dest='server_filter', action='store_false',
+                                     help='download all the children and match titles locally')
+    daily_update_parser.add_argument('--cache-file', help='file to keep page tree listings across runs')
+    daily_update_parser.add_argument('--body-cache-dir', help='directory to keep page bodies across runs')
+    daily_update_parser.add_argument('--cache-ttl', help='seconds a cached listing is used',
+                                     type=int, default=DEFAULT_TTL)
+
+    bulk_copy_parser = cmd_parser.add_parser('bulk-copy', help='copy many pages listed in a manifest')
+    bulk_copy_parser.add_argument('--space', help='space name', required=True)
+    bulk_copy_parser.add_argument('--manifest', help='yaml list of from, into and title-format', required=True)
+    bulk_copy_parser.add_argument('--jobs', help='number of copies submitted at once', default=4, type=int)
+
+    sync_parser = cmd_parser.add_parser('sync', help='mirror pages of a space into a local directory')
+    sync_parser.add_argument('--space', help='space name', required=True)
+    sync_parser.add_argument('--dir', help='directory of the mirror', required=True)
+    sync_parser.add_argument('--jobs', help='number of pages downloaded at once', default=4, type=int)
+
+    transform_parser = cmd_parser.add_parser('transform', help='apply the daily update to storage format files')
+    transform_parser.add_argument('--file', help='storage format files', required=True, nargs='+')
+    transform_parser.add_argument('--out-dir', help='directory to write transformed files', required=True)
+    transform_parser.add_argument('--workers', help='number of processes', type=int)
 
     new_month_parser = cmd_parser.add_parser('new-month', help='prepare for new month')
     new_month_parser.add_argument('--space', help='space name', required=True)
     new_month_parser.add_argument('--from', dest='frm', help='page to be copied from', required=True)
     new_month_parser.add_argument('--title-format', help='page title', required=True)
+    new_month_parser.add_argument('--child-title-format', default='{month} {title}',
+                                  help='title of cloned pages, {month} and {title} are replaced')
+    new_month_parser.add_argument('--jobs', help='number of requests sent at once', default=4, type=int)
+    new_month_parser.add_argument('--workers', help='number of processes transforming bodies', type=int)
 
     download_adf_parser = cmd_parser.add_parser('download-adf', help='download atlassian doc format data')
     download_adf_parser.add_argument('--page-id', help='page ids', required=True, type=int, nargs='+')
     download_adf_parser.add_argument('--dir', help='file name', required=True)
+    download_adf_parser.add_argument('--body-cache-dir', help='directory to keep page bodies across runs')
+    download_adf_parser.add_argument('--jobs', help='number of pages downloaded at once', default=4, type=int)
 
     validate_adf_parser = cmd_parser.add_parser('validate-adf', help='validate atlassian doc format data')
     validate_adf_parser.add_argument('--schema-file', help='file name of atlassian doc format json schema', required=True)
@@ -63,6 +104,18 @@ def parse_args():
     return args
 
 
+def find_space(url, auth, space_name):
+    (sc, res) = get_space(url, auth)
+    if sc != 200:
+        logging.error(f"get_space() error")
+        sys.exit(1)
+    spaces = list(filter(lambda dic: dic['name'] == space_name, res['results']))
+    if len(spaces) != 1:
+        logging.error(f"multiple {space_name} found")
+        sys.exit(1)
+    return spaces[0]
+
+
 # As newer date should get higher priority, the function
 # rturns matched datetime. If title and fmt is same,
 # it will get maximum priority.
@@ -76,30 +129,32 @@ if __name__ == '__main__':
     email = args.email
     token = args.token
     auth = HTTPBasicAuth(email, token)
+    # every request in flight needs its own connection to be kept alive.
+    pool_size = max(args.pool_size, getattr(args, 'jobs', 1))
+    confluence.net.set_session(confluence.net.create_session(pool_maxsize=pool_size))
+    confluence.net.set_scheduler(Scheduler(rate=args.rate, max_retries=args.max_retries,
+                                           endpoint_limit=args.endpoint_limit))
     now = datetime.datetime.now()
 
     if args.command == "daily-update":
+        cache = None
+        body_cache = PageBodyCache(args.body_cache_dir) if args.body_cache_dir else None
         try:
-            space_name = args.space
             logging.info("get space name")
-            (sc, res) = get_space(url, auth)
-            if sc != 200:
-                logging.error(f"get_space() error")
-                sys.exit(1)
-            sapces = list(filter(lambda dic: dic['name'] == space_name, res['results']))
-            if len(sapces) != 1:
-                logging.error(f"multiple {space_name} found")
-                sys.exit(1)
-            space_id = sapces[0]['id']
-
-            homepage_id = sapces[0]['homepageId']
-            top_pages = get_children(url, auth, homepage_id)
+            space = find_space(url, auth, args.space)
+            space_id = space['id']
+            homepage_id = space['homepageId']
+            if args.cache_file:
+                cache = PageTreeCache(args.cache_file, space_id, homepage_id, args.cache_ttl)
+            top_pages = get_children(url, auth, homepage_id, cache)
             if not top_pages:
                 logging.error(f"getting children of homepage failed")
                 sys.exit(1)
 
-            logging.info(f"get page down through {args.frm}")
-            src_page = find_page_by_path(url, auth, top_pages, args.frm.split('/'))
+            logging.info(f"get page down through {args.frm} and {args.into}")
+            (src_page, to_page) = find_pages_by_paths(url, auth, top_pages,
+                                                      [args.frm.split('/'), args.into.split('/')],
+                                                      cache, args.server_filter, space_id)
             if src_page is None:
                 logging.error(f"src page not found:{args.frm}")
                 sys.exit(1)
@@ -108,46 +163,52 @@ if __name__ == '__main__':
             new_title = now.strftime(args.title_format)
             tmp_title = now.strftime(f"{args.title_format}-%f")
 
-            logging.info(f"find a page to be copied in")
-            to_page = find_page_by_path(url, auth, top_pages, args.into.split('/'))
             if to_page is None:
                 logging.error(f"destination parent not found:{args.into}")
                 sys.exit(1)
 
             logging.info(f"copy page from {old_title} to {new_title} in {to_page['title']}")
-            (sc_copy, res_copy) = copy_page(url, auth, src_page, to_page, tmp_title)
+            (sc_copy, res_copy) = copy_page(url, auth, src_page, to_page, tmp_title, cache)
             dst_page = res_copy
             if sc_copy != 200:
                 logging.error(f"copy page failed:{src_page}")
                 sys.exit(1)
             # TODO: after copy_page() is succeeded, any error can cause to\
             #  leave a temporary file named with dummy_title. It has to be deleted.
-            logging.info(f"update body of new page")
-            (sc_update, res_update) = update_page(url, auth, src_page['id'], update_tree, space_id, new_title)
-            if sc_update != 200:
-                logging.error("update_page() failed")
-
-            logging.info(f"Rename title from {tmp_title} to {old_title}")
-            (sc_rename, res_rename) = rename_page(url, auth, dst_page['id'], old_title)
-            if sc_rename != 200:
-                logging.error("rename_page() failed")
+            logging.info(f"update body of {old_title} and rename {tmp_title} to {old_title}")
+            plans = merge_plans([
+                PagePlan(src_page['id'], space_id=space_id).transform(update_tree).rename(new_title),
+                PagePlan(dst_page['id']).rename(old_title),
+            ])
+            handles = {str(dst_page['id']): page_handle_from_v1(dst_page, space_id)}
+            for plan in plans:
+                (sc_plan, res_plan) = apply_plan(url, auth, plan, cache, handles.get(str(plan.page_id)),
+                                                 body_cache)
+                if sc_plan != 200:
+                    logging.error(f"writing page {plan.page_id} failed")
         except Exception as ex:
             logging.error(ex)
             sys.exit(1)
+        finally:
+            if cache is not None:
+                cache.save()
+            if body_cache is not None:
+                body_cache.save()
     elif args.command == 'download-adf':
         import os
         import pprint as pp
         if not os.path.isdir(args.dir):
             sys.exit(f"No such directory {args.dir}")
 
-        for page_id in args.page_id:
-            (sc, rsp) = get_page_by_id(url, auth, page_id, "atlas_doc_format")
-            if sc == 200:
-                json_str = rsp['body']['atlas_doc_format']['value']
-                title = rsp['title'].lower()
-                json_obj = json.loads(json_str)
-                with open(os.path.join(args.dir, f"{title}.json"), "w") as f:
-                    json.dump(json_obj, f)
+        body_cache = PageBodyCache(args.body_cache_dir) if args.body_cache_dir else None
+        try:
+            res = download_adf(url, auth, args.page_id, args.dir, args.jobs, body_cache)
+        finally:
+            if body_cache is not None:
+                body_cache.save()
+        failed = [page_id for (page_id, r) in res if isinstance(r, BaseException)]
+        if failed:
+            sys.exit(f"download failed: {' '.join(map(str, failed))}")
     elif args.command == 'validate-adf':
         schema = None
         adf = None
@@ -163,8 +224,63 @@ if __name__ == '__main__':
                 parsed_adf = jsonschema.validater.parse_structure(adf_schema, doc_schema, adf)
                 pp.pprint(parsed_adf)
 
+    elif args.command == 'bulk-copy':
+        space = find_space(url, auth, args.space)
+        top_pages = get_children(url, auth, space['homepageId'])
+        if not top_pages:
+            logging.error(f"getting children of homepage failed")
+            sys.exit(1)
+        entries = load_manifest(args.manifest)
+        res = bulk_copy(url, auth, top_pages, entries, now, args.jobs)
+        for (entry, r) in res:
+            if not isinstance(r, BaseException):
+                print(f"{entry.frm} -> {entry.into}: {' '.join(r)}")
+        if any(isinstance(r, BaseException) for (_, r) in res):
+            sys.exit(1)
+    elif args.command == 'sync':
+        space = find_space(url, auth, args.space)
+        mirror = Mirror(args.dir)
+        try:
+            (fetched, removed) = sync_space(url, auth, space, mirror, args.jobs)
+            print(f"{len(fetched)} pages fetched, {len(removed)} pages removed")
+        except Exception as ex:
+            logging.error(ex)
+            sys.exit(1)
+        finally:
+            mirror.close()
+    elif args.command == 'transform':
+        import os
+        if not os.path.isdir(args.out_dir):
+            sys.exit(f"No such directory {args.out_dir}")
+        res = transform_files(args.file, args.out_dir, update_tree, args.workers)
+        failed = [file for (file, r) in res if isinstance(r, Exception)]
+        for (file, r) in res:
+            if isinstance(r, Exception):
+                logging.error(f"transform {file} failed: {r}")
+        if failed:
+            sys.exit(f"transform failed: {' '.join(failed)}")
     elif args.command == 'new-month':
-        sys.exit('not implemented yet')
+        space = find_space(url, auth, args.space)
+        top_pages = get_children(url, auth, space['homepageId'])
+        if not top_pages:
+            logging.error(f"getting children of homepage failed")
+            sys.exit(1)
+        components = args.frm.split('/')
+        (parent, src_month) = find_pages_by_paths(url, auth, top_pages, [components[:-1], components])
+        if len(components) == 1:
+            parent = {'id': space['homepageId'], 'title': space['name']}
+        if src_month is None or parent is None:
+            logging.error(f"src page not found:{args.frm}")
+            sys.exit(1)
+
+        month_title = now.strftime(args.title_format)
+        logging.info(f"clone {src_month['title']} to {month_title}")
+        res = clone_tree(url, auth, src_month, parent, month_title,
+                         lambda title: args.child_title_format.format(month=month_title, title=title),
+                         space['id'], update_tree, args.jobs, args.workers)
+        failed = [page_id for (page_id, r) in res if isinstance(r, BaseException)]
+        if failed:
+            sys.exit(f"clone failed: {' '.join(map(str, failed))}")
 
     else:
         print(f"{args.command} unhandled")
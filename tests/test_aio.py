@@ -0,0 +1,102 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import confluence.aio
+
+
+class StandIn(BaseHTTPRequestHandler):
+    pages = {
+        "1": {"id": "1", "title": "one", "spaceId": "10"},
+        "2": {"id": "2", "title": "two", "spaceId": "10"},
+    }
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        page_id = path.rsplit('/', 1)[-1]
+        if path.startswith("/wiki/api/v2/pages/") and page_id in self.pages:
+            self.reply(200, self.pages[page_id])
+        else:
+            self.reply(404, {"message": "not found"})
+
+    def reply(self, status, obj):
+        data = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_get_page_by_id_concurrently():
+    server = serve()
+    url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        async def run():
+            return await asyncio.gather(
+                confluence.aio.get_page_by_id(url, None, 1),
+                confluence.aio.get_page_by_id(url, None, 2),
+                confluence.aio.get_page_by_id(url, None, 3))
+        res = asyncio.run(run())
+    finally:
+        server.shutdown()
+    assert res[0] == (200, StandIn.pages["1"])
+    assert res[1] == (200, StandIn.pages["2"])
+    assert res[2][0] == 404
+
+
+def test_gather_limited_keeps_order_and_errors():
+    async def ok(n):
+        await asyncio.sleep(0)
+        return n
+
+    async def ng():
+        raise ValueError("ng")
+
+    res = asyncio.run(confluence.aio.gather_limited([ok(1), ng(), ok(3)], 2))
+    assert res[0] == 1
+    assert isinstance(res[1], ValueError)
+    assert res[2] == 3
+
+
+def test_wait_for_tasks(monkeypatch):
+    import confluence.api
+    polls = {"t1": [30, 60, 100], "t2": [100]}
+
+    def get_long_running_task_by_id(url, auth, task_id):
+        progress = polls[task_id].pop(0)
+        return (200, {'id': task_id, 'percentageComplete': progress, 'finished': progress == 100,
+                      'successful': True, 'additionalDetails': {'destinationId': f"page-{task_id}"}})
+    monkeypatch.setattr(confluence.api, "get_long_running_task_by_id", get_long_running_task_by_id)
+
+    res = asyncio.run(confluence.aio.wait_for_tasks("", None, ["t1", "t2"], interval=0.001))
+    assert [confluence.aio.task_page_ids(task) for (_, task) in res] == [["page-t1"], ["page-t2"]]
+    assert polls == {"t1": [], "t2": []}
+
+
+def test_long_task_id():
+    assert confluence.aio.long_task_id({'id': "9", 'links': {'status': "/rest/api/longtask/9"}}) == "9"
+    assert confluence.aio.long_task_id({'id': "9", 'title': "page"}) is None
+
+
+def test_run_has_jobs_threads():
+    # more calls than the default executor of asyncio would run at once
+    jobs = 40
+    barrier = threading.Barrier(jobs, timeout=5)
+
+    async def main():
+        return await confluence.aio.gather_limited(
+            [asyncio.to_thread(barrier.wait) for _ in range(jobs)], jobs)
+
+    res = confluence.aio.run(main(), jobs)
+    assert not [r for r in res if isinstance(r, BaseException)]
@@ -0,0 +1,21 @@
+from confluence.batch import transform_bodies, transform_files
+from confluence.content import update_tree
+from confluence.storage import default_codec
+
+
+def test_transform_bodies_in_order():
+    bodies = [f"<h1>a{i}</h1><h1>b{i}</h1><p>{i}</p>" for i in range(6)] + ["<x:bad />"]
+    res = list(transform_bodies(iter(bodies), update_tree, workers=2, window=3))
+    for (body, r) in zip(bodies[:-1], res):
+        assert r == default_codec.serialize(update_tree(default_codec.parse(body)))
+    assert isinstance(res[-1], Exception)
+
+
+def test_transform_files(tmp_path):
+    src = tmp_path / "1.storage"
+    src.write_text("<h1>a</h1><h1>b</h1>", encoding="utf-8")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    res = transform_files([str(src)], str(out_dir), workers=1)
+    assert res == [(str(src), str(out_dir / "1.storage"))]
+    assert (out_dir / "1.storage").read_text(encoding="utf-8") == "<h1>a</h1><h1>b</h1>"
@@ -0,0 +1,156 @@
+import json
+
+import confluence.aio
+from confluence.bulk import download_adf
+
+
+def test_download_adf_reports_failures(tmp_path, monkeypatch):
+    async def get_page_by_id(url, auth, page_id, body_format='storage', body_cache=None):
+        if page_id == 2:
+            return (404, {})
+        doc = json.dumps({"type": "doc", "id": page_id})
+        return (200, {'title': f"Page{page_id}",
+                      'body': {'atlas_doc_format': {'value': doc}}})
+    monkeypatch.setattr(confluence.aio, "get_page_by_id", get_page_by_id)
+
+    res = download_adf("", None, [1, 2, 3], str(tmp_path), 2)
+    assert [page_id for (page_id, _) in res] == [1, 2, 3]
+    assert isinstance(res[1][1], RuntimeError)
+    with open(tmp_path / "page3.json") as f:
+        assert json.load(f) == {"type": "doc", "id": 3}
+    assert not (tmp_path / "page2.json").exists()
+
+
+def test_bulk_copy_shared_lookup(monkeypatch):
+    import datetime
+    from unittest.mock import Mock
+    import confluence.api
+    from confluence.bulk import CopyEntry, bulk_copy
+
+    year = {'title': "2000", 'id': 1}
+    src = {'title': "src", 'id': 2}
+    dst = {'title': "dst", 'id': 3}
+    get_children = Mock(return_value=[src, dst])
+    monkeypatch.setattr(confluence.api, "get_children", get_children)
+
+    async def copy_page(url, auth, src_page, to_page, new_title, cache=None, copy_descendants=True):
+        return (200, {'id': f"{src_page['id']}-{to_page['id']}-{new_title}"})
+    monkeypatch.setattr(confluence.aio, "copy_page", copy_page)
+
+    entries = [CopyEntry("%Y/src", "%Y/dst", "new-%m"), CopyEntry("%Y/none", "%Y/dst", "x")]
+    res = bulk_copy("", None, [year], entries, datetime.datetime(2000, 5, 1), 2)
+    assert res[0] == (entries[0], ["2-3-new-05"])
+    assert isinstance(res[1][1], LookupError)
+    get_children.assert_called_once()
+
+
+def test_bulk_copy_tracks_tasks_outside_limit(monkeypatch):
+    import asyncio
+    import datetime
+    from unittest.mock import Mock
+    import confluence.api
+    from confluence.bulk import CopyEntry, bulk_copy
+
+    year = {'title': "2000", 'id': 1}
+    pages = [{'title': f"p{i}", 'id': i} for i in range(10, 14)]
+    monkeypatch.setattr(confluence.api, "get_children", Mock(return_value=pages))
+    submitted = []
+    in_flight = []
+
+    async def copy_page(url, auth, src_page, to_page, new_title, cache=None, copy_descendants=True):
+        in_flight.append(src_page['id'])
+        await asyncio.sleep(0)
+        assert len(in_flight) <= 1
+        in_flight.remove(src_page['id'])
+        submitted.append(src_page['id'])
+        if src_page['id'] == 12:
+            return (200, {'id': "new12"})
+        return (202, {'id': f"task{src_page['id']}", 'links': {'status': "/rest/api/longtask/x"}})
+
+    async def get_long_running_task_by_id(url, auth, task_id):
+        # every copy has been submitted before any task is polled
+        assert len(submitted) == 3
+        if task_id == "task11":
+            return (200, {'finished': True, 'successful': False, 'messages': ["no"]})
+        return (200, {'finished': True, 'successful': True,
+                      'additionalDetails': {'destinationId': f"new-{task_id}"}})
+    monkeypatch.setattr(confluence.aio, "copy_page", copy_page)
+    monkeypatch.setattr(confluence.aio, "get_long_running_task_by_id", get_long_running_task_by_id)
+
+    entries = [CopyEntry("%Y/p10", "%Y/p13", "a"), CopyEntry("%Y/p11", "%Y/p13", "b"),
+               CopyEntry("%Y/p12", "%Y/p13", "c")]
+    res = bulk_copy("", None, [year], entries, datetime.datetime(2000, 5, 1), 1)
+    assert res[0][1] == ["new-task10"]
+    assert isinstance(res[1][1], RuntimeError)
+    assert res[2][1] == ["new12"]
+
+
+def test_load_manifest(tmp_path):
+    from confluence.bulk import CopyEntry, load_manifest
+    path = tmp_path / "manifest.yaml"
+    path.write_text("- from: a/b\n  into: c\n  title-format: '%Y'\n")
+    assert load_manifest(str(path)) == [CopyEntry("a/b", "c", "%Y")]
+
+
+def test_clone_tree(monkeypatch):
+    import itertools
+    from confluence.api import PageHandle, transform_storage
+    from confluence.content import update_tree
+    from confluence.bulk import clone_tree
+
+    tree = {1: [{'id': 2, 'title': "day1"}, {'id': 3, 'title': "day2"}], 2: [], 3: []}
+    ids = itertools.count(10)
+    copies = []
+
+    async def copy_page(url, auth, src_page, to_page, new_title, cache=None, copy_descendants=True):
+        assert copy_descendants is False
+        copies.append((src_page['id'], to_page['id'], new_title))
+        return (200, {'id': next(ids), 'title': new_title, 'version': {'number': 1},
+                      'body': {'storage': {'value': "<h1>a</h1><h1>b</h1>"}}})
+
+    async def list_children(url, auth, page_id):
+        return tree[page_id]
+
+    async def write_page(url, auth, handle, change, cache=None):
+        (title, body) = change(handle)
+        return (200, {}, PageHandle(handle.id, title, handle.space_id, handle.version + 1, body))
+
+    monkeypatch.setattr(confluence.aio, "copy_page", copy_page)
+    monkeypatch.setattr(confluence.aio, "list_children", list_children)
+    monkeypatch.setattr(confluence.aio, "write_page", write_page)
+
+    res = clone_tree("", None, {'id': 1, 'title': "month"}, {'id': 0}, "new month",
+                     lambda title: f"new {title}", "space", update_tree, 2, 1)
+    assert copies[0] == (1, 0, "new month")
+    assert sorted(copies[1:]) == [(2, "10", "new day1"), (3, "10", "new day2")]
+    assert len(res) == 3
+    expected = transform_storage("<h1>a</h1><h1>b</h1>", update_tree)
+    for (_, handle) in res:
+        assert handle.version == 2
+        assert handle.body == expected
+
+
+def test_clone_tree_reports_failed_listing(monkeypatch):
+    import itertools
+    import requests
+    from confluence.bulk import clone_tree
+
+    ids = itertools.count(10)
+
+    async def copy_page(url, auth, src_page, to_page, new_title, cache=None, copy_descendants=True):
+        return (200, {'id': next(ids), 'title': new_title, 'version': {'number': 1},
+                      'body': {'storage': {'value': ""}}})
+
+    async def list_children(url, auth, page_id):
+        if page_id == 1:
+            return [{'id': 2, 'title': "day1"}]
+        raise requests.HTTPError("500")
+
+    monkeypatch.setattr(confluence.aio, "copy_page", copy_page)
+    monkeypatch.setattr(confluence.aio, "list_children", list_children)
+
+    res = clone_tree("", None, {'id': 1, 'title': "month"}, {'id': 0}, "new month",
+                     lambda title: f"new {title}", "space")
+    # day1 is cloned, but listing its children failed.
+    assert [page_id for (page_id, r) in res if not isinstance(r, BaseException)] == [2, 1]
+    assert [page_id for (page_id, r) in res if isinstance(r, requests.HTTPError)] == [2]
@@ -0,0 +1,90 @@
+import time
+
+from confluence.cache import PageTreeCache
+
+
+def test_cache_round_trip(tmp_path):
+    path = str(tmp_path / "tree.json")
+    cache = PageTreeCache(path, "space", "home")
+    cache.put(1, [{'id': '2', 'title': "child"}])
+    cache.save()
+
+    loaded = PageTreeCache(path, "space", "home")
+    assert loaded.get(1) == [{'id': '2', 'title': "child"}]
+
+
+def test_cache_other_space_ignored(tmp_path):
+    path = str(tmp_path / "tree.json")
+    cache = PageTreeCache(path, "space", "home")
+    cache.put(1, [])
+    cache.save()
+
+    assert PageTreeCache(path, "space", "other").get(1) is None
+
+
+def test_cache_ttl_expired():
+    cache = PageTreeCache(None, "space", "home", ttl=10)
+    cache.put(1, [])
+    cache.pages['1']['time'] = time.time() - 20
+    assert cache.get(1) is None
+
+
+def test_cache_invalidate_and_update_page():
+    cache = PageTreeCache(None, "space", "home")
+    cache.put(1, [{'id': '2', 'title': "old"}])
+    cache.put(3, [])
+    cache.update_page({'id': 2, 'title': "new"})
+    assert cache.get(1) == [{'id': '2', 'title': "new"}]
+    cache.invalidate(3)
+    assert cache.get(3) is None
+    cache.invalidate()
+    assert cache.get(1) is None
+
+
+def test_page_body_cache_round_trip(tmp_path):
+    from confluence.cache import PageBodyCache
+    page = {'id': "1", 'title': "t", 'version': {'number': 3}, 'body': {'storage': {'value': "<p>x</p>"}}}
+    cache = PageBodyCache(str(tmp_path))
+    cache.put(page, 'storage')
+    copied = dict(page, id="2")
+    cache.put(copied, 'storage')
+    # same body is stored once
+    assert len(list((tmp_path / "objects").iterdir())) == 1
+    cache.save()
+
+    loaded = PageBodyCache(str(tmp_path))
+    assert loaded.get("1", 3, 'storage') == page
+    assert loaded.get("1", 4, 'storage') is None
+    assert loaded.get("1", 3, 'atlas_doc_format') is None
+
+
+def test_get_page_by_id_served_from_body_cache(tmp_path, monkeypatch):
+    import json
+    from unittest.mock import Mock
+    import confluence.api
+    from confluence.cache import PageBodyCache
+    page = {'id': "1", 'title': "t", 'version': {'number': 3}, 'body': {'storage': {'value': "<p>x</p>"}}}
+    cache = PageBodyCache(str(tmp_path))
+    cache.put(page, 'storage')
+    versions = Mock(status_code=200, content=json.dumps({'results': [{'number': 3}]}).encode())
+    get = Mock(return_value=versions)
+    monkeypatch.setattr(confluence.api, "get", get)
+
+    assert confluence.api.get_page_by_id("url", None, "1", 'storage', cache) == (200, page)
+    assert get.call_count == 1
+    assert "/versions" in get.call_args.args[0]
+
+
+def test_page_body_cache_concurrent_put(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from confluence.cache import PageBodyCache
+    cache = PageBodyCache(str(tmp_path))
+    pages = [{'id': str(i), 'title': "t", 'version': {'number': 1}, 'body': {'storage': {'value': "<p>x</p>"}}}
+             for i in range(32)]
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda p: cache.put(p, 'storage'), pages))
+    assert [p.name for p in (tmp_path / "objects").iterdir()] == [cache.index["0:1:storage"]['digest']]
+    # the index is only written on save()
+    assert not (tmp_path / "index.json").exists()
+    cache.save()
+    assert PageBodyCache(str(tmp_path)).get("31", 1, 'storage') == pages[31]
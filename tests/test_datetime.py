@@ -16,3 +16,37 @@ def test_datetime_strptime_invalid():
     except ValueError as ex:
         assert True, "this should be OK"
 
+
+def test_title_matcher_date():
+    from confluence.title import compile_title_format
+    matcher = compile_title_format("test-%Y-%m-%d")
+    assert matcher.match("test-2023-01-02") == ("test-2023-01-02", datetime.datetime(2023, 1, 2))
+    assert matcher.match("other-2023-01-02") == (None, datetime.datetime.min)
+    assert matcher.match("test-2023-13-02") == (None, datetime.datetime.min)
+    assert matcher.match("test-%Y-%m-%d") == ("test-%Y-%m-%d", datetime.datetime.max)
+
+def test_title_matcher_white_space_run():
+    from confluence.title import compile_title_format
+    matcher = compile_title_format("Daily  %Y-%m-%d")
+    assert datetime.datetime.strptime("Daily 2024-05-01", "Daily  %Y-%m-%d")
+    assert matcher.match("Daily 2024-05-01") == ("Daily 2024-05-01", datetime.datetime(2024, 5, 1))
+    assert matcher.match("Daily \t 2024-05-01")[1] == datetime.datetime(2024, 5, 1)
+
+def test_title_matcher_no_directive():
+    from confluence.title import compile_title_format
+    matcher = compile_title_format("exact")
+    assert matcher.literal
+    assert matcher.match("exact") == ("exact", datetime.datetime.max)
+    assert matcher.match("exact2") == (None, datetime.datetime.min)
+
+def test_title_matcher_no_directive_like_strptime():
+    from confluence.api import interpret_as_datetime
+    expected = datetime.datetime.strptime("daily  report", "Daily Report")
+    assert interpret_as_datetime("daily  report", "Daily Report") == ("daily  report", expected)
+    assert interpret_as_datetime("Daily Reports", "Daily Report") == (None, datetime.datetime.min)
+
+def test_title_matcher_rank():
+    from confluence.title import compile_title_format
+    pages = [{'title': "2000-01"}, {'title': "memo"}, {'title': "2000-03"}, {'title': "%Y-%m"}]
+    ranked = compile_title_format("%Y-%m").rank(pages)
+    assert [page['title'] for (_, page) in ranked] == ["%Y-%m", "2000-03", "2000-01"]
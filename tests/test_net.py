@@ -1,4 +1,6 @@
+import json
 import unittest
+from unittest.mock import Mock
 
 from confluence.net import merge_results, format_query_parameter
 
@@ -27,4 +29,103 @@ def test_query_param_one_item():
 def test_query_param_two_items():
     qp = {'one':1, 'two':2}
     res = format_query_parameter(qp)
-    assert res == "one=1&two=2"
\ No newline at end of file
+    assert res == "one=1&two=2"
+
+def test_create_session_mounts_adapter():
+    from requests.adapters import HTTPAdapter
+    from confluence.net import create_session
+    adapter = HTTPAdapter()
+    session = create_session(adapter=adapter)
+    assert session.get_adapter("https://example.com/") is adapter
+    assert session.get_adapter("http://example.com/") is adapter
+
+
+def test_set_session_returns_previous():
+    from confluence.net import set_session, get_session
+    session = Mock()
+    prev = set_session(session)
+    try:
+        assert get_session() is session
+    finally:
+        set_session(prev)
+
+
+def fake_response(status_code, obj, link=None):
+    headers = {} if link is None else {"link": link}
+    data = json.dumps(obj).encode()
+    return Mock(status_code=status_code, content=data, headers=headers, url="url",
+                iter_content=lambda size: [data[i:i + 3] for i in range(0, len(data), 3)])
+
+
+def test_iter_get_v2_follows_link(monkeypatch):
+    import confluence.net
+    pages = {
+        None: fake_response(200, {'results': [1, 2]}, '<cursor1>; rel="next"'),
+        'cursor1': fake_response(200, {'results': [3]}),
+    }
+    def request(method, url, **kwargs):
+        return pages['cursor1' if 'next=cursor1' in url else None]
+    monkeypatch.setattr(confluence.net, "request", request)
+
+    assert list(confluence.net.iter_get_v2("url?", None, 2)) == [1, 2, 3]
+
+
+def test_iter_get_v2_error(monkeypatch):
+    import pytest
+    import requests
+    import confluence.net
+    monkeypatch.setattr(confluence.net, "request", lambda *args, **kwargs: fake_response(404, {}))
+
+    with pytest.raises(requests.HTTPError):
+        list(confluence.net.iter_get_v2("url?", None, 2))
+
+
+def test_iter_get_parallel_windows_in_order(monkeypatch):
+    import re
+    import confluence.net
+    items = list(range(7))
+    def request(method, url, **kwargs):
+        start = int(re.search('start=([0-9]+)', url).group(1))
+        results = items[start:start + 2]
+        return fake_response(200, {'results': results, 'size': len(results), 'limit': 2})
+    monkeypatch.setattr(confluence.net, "request", request)
+
+    assert list(confluence.net.iter_get("url?", None, 2, parallel=3)) == items
+
+
+def test_iter_get_submits_all_windows_with_total_size(monkeypatch):
+    import re
+    import threading
+    import confluence.net
+    items = list(range(9))
+    last = threading.Event()
+    def request(method, url, **kwargs):
+        start = int(re.search('start=([0-9]+)', url).group(1))
+        if start == 8:
+            last.set()
+        if start == 2:
+            # the last window is requested while the first one is still
+            # waited for, so it didn't wait for a free slot in a window.
+            assert last.wait(5)
+        results = items[start:start + 2]
+        return fake_response(200, {'results': results, 'size': len(results), 'limit': 2,
+                                   'totalSize': len(items)})
+    monkeypatch.setattr(confluence.net, "request", request)
+
+    assert list(confluence.net.iter_get("url?", None, 2, parallel=2)) == items
+
+
+def test_iter_json_items_split_chunks():
+    from confluence.net import iter_json_items
+    data = json.dumps({'_links': {'next': "x"}, 'results': [{'id': 1, 'title': "\u3042"}, 12345, "s"],
+                       'size': 3}, ensure_ascii=False).encode()
+    for n in [1, 2, 7, len(data)]:
+        chunks = [data[i:i + n] for i in range(0, len(data), n)]
+        assert list(iter_json_items(chunks, 'results')) == [{'id': 1, 'title': "\u3042"}, 12345, "s"]
+
+
+def test_iter_json_items_truncated():
+    import pytest
+    from confluence.net import iter_json_items
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_items([b'{"results": [{"id": 1}, {"id"'], 'results'))
@@ -82,3 +82,57 @@ def test_get_children_200():
     confluence.api.multi_get_v2 = Mock(return_value = (200, {'results':["a"]}))
     res = get_children("url", "auth", 123)
     assert res == ["a"]
+
+
+def test_find_pages_by_paths_shares_prefix(monkeypatch):
+    from confluence.api import find_pages_by_paths
+    year = {'title': "2000", "id": 1}
+    src = {'title': "src", "id": 2}
+    dst = {'title': "dst", "id": 3}
+    get_children_mock = Mock(return_value=[src, dst])
+    monkeypatch.setattr(confluence.api, "get_children", get_children_mock)
+
+    res = find_pages_by_paths("", "", [year], [["%Y", "src"], ["%Y", "dst"], ["%Y", "none"], []])
+    assert res == [src, dst, None, None]
+    get_children_mock.assert_called_once_with("", "", 1, None)
+
+
+def test_find_children_by_title_exact(monkeypatch):
+    from confluence.api import find_children_by_title
+    pages = [{'title': "exact", 'id': 2, 'parentId': 1}, {'title': "exact", 'id': 3, 'parentId': 9}]
+    multi_get_v2_mock = Mock(return_value=(200, {'results': pages}))
+    monkeypatch.setattr(confluence.api, "multi_get_v2", multi_get_v2_mock)
+
+    res = find_children_by_title("url", "auth", 1, "exact")
+    assert res == [pages[0]]
+    assert multi_get_v2_mock.call_args.args[3] == {"title": "exact"}
+    find_children_by_title("url", "auth", 1, "exact", "10")
+    assert multi_get_v2_mock.call_args.args[3] == {"title": "exact", "space-id": "10"}
+
+
+def test_find_children_by_title_prefix(monkeypatch):
+    from confluence.api import find_children_by_title
+    iter_get_mock = Mock(return_value=iter([{'title': "Daily 2000-01-02"}]))
+    monkeypatch.setattr(confluence.api, "iter_get", iter_get_mock)
+
+    res = find_children_by_title("url", "auth", 1, "Daily %Y-%m-%d")
+    assert res == [{'title': "Daily 2000-01-02"}]
+    cql = iter_get_mock.call_args.args[3]['cql']
+    assert cql == 'parent%20%3D%201%20and%20title%20~%20%22daily%2A%22'
+
+
+def test_find_children_by_title_not_expressible():
+    from confluence.api import find_children_by_title
+    assert find_children_by_title("url", "auth", 1, "%Y-%m") is None
+
+
+def test_get_candidate_children_falls_back_without_match(monkeypatch):
+    from confluence.api import get_candidate_children
+    # the search index doesn't know the new page yet
+    monkeypatch.setattr(confluence.api, "iter_get", Mock(return_value=iter([{'title': "Daily memo"}])))
+    children = [{'title': "Daily memo"}, {'title': "Daily 2000-01-02"}]
+    get_children_mock = Mock(return_value=children)
+    monkeypatch.setattr(confluence.api, "get_children", get_children_mock)
+
+    assert get_candidate_children("url", "auth", 1, ["Daily %Y-%m-%d"], server_filter=True) == children
+    get_children_mock.assert_called_once_with("url", "auth", 1, None)
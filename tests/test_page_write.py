@@ -0,0 +1,97 @@
+import json
+from unittest.mock import Mock
+
+import confluence.api
+from confluence.api import PageHandle, rename_page, write_page, page_handle_from_v1
+
+
+def response(status_code, obj={}):
+    return Mock(status_code=status_code, content=json.dumps(obj).encode())
+
+
+def v2_page(version, body):
+    return {'id': "1", 'title': "title", 'spaceId': "10",
+            'version': {'number': version}, 'body': {'storage': {'value': body}}}
+
+
+def test_rename_page_with_handle_skips_get(monkeypatch):
+    put = Mock(return_value=response(200, {'id': "1"}))
+    get_page_by_id = Mock()
+    monkeypatch.setattr(confluence.api, "put", put)
+    monkeypatch.setattr(confluence.api, "get_page_by_id", get_page_by_id)
+
+    handle = PageHandle("1", "old", "10", 3, "<p>body</p>")
+    (sc, _) = rename_page("url", "auth", "1", "new", handle=handle)
+    assert sc == 200
+    get_page_by_id.assert_not_called()
+    payload = json.loads(put.call_args.args[2])
+    assert payload['title'] == "new"
+    assert payload['version'] == {'number': 4}
+    assert payload['body']['value'] == "<p>body</p>"
+
+
+def test_write_page_refetches_on_conflict(monkeypatch):
+    put = Mock(side_effect=[response(409), response(200)])
+    monkeypatch.setattr(confluence.api, "put", put)
+    monkeypatch.setattr(confluence.api, "get_page_by_id", Mock(return_value=(200, v2_page(7, "<p>latest</p>"))))
+
+    handle = PageHandle("1", "title", "10", 3, "<p>stale</p>")
+    (sc, _, written) = write_page("url", "auth", handle, lambda h: ("new", h.body + "!"))
+    assert sc == 200
+    payload = json.loads(put.call_args.args[2])
+    assert payload['version'] == {'number': 8}
+    assert payload['body']['value'] == "<p>latest</p>!"
+    assert written == PageHandle("1", "new", "10", 8, "<p>latest</p>!")
+
+
+def test_write_page_conflict_with_own_write(monkeypatch):
+    # the first PUT was applied, but its response was lost
+    put = Mock(return_value=response(409))
+    monkeypatch.setattr(confluence.api, "put", put)
+    applied = dict(v2_page(4, "<p>x</p>!"), title="new")
+    monkeypatch.setattr(confluence.api, "get_page_by_id", Mock(return_value=(200, applied)))
+    change = Mock(side_effect=lambda h: ("new", h.body + "!"))
+
+    handle = PageHandle("1", "title", "10", 3, "<p>x</p>")
+    (sc, _, written) = write_page("url", "auth", handle, change)
+    assert sc == 200
+    assert change.call_count == 1
+    assert put.call_count == 1
+    assert written == PageHandle("1", "new", "10", 4, "<p>x</p>!")
+
+
+def test_page_handle_from_v1():
+    resp = {'id': 5, 'title': "copy", 'version': {'number': 1}, 'body': {'storage': {'value': "<p/>"}}}
+    assert page_handle_from_v1(resp, 10) == PageHandle("5", "copy", "10", 1, "<p/>")
+    assert page_handle_from_v1({'id': 5, 'title': "copy"}, 10) is None
+
+
+def test_merge_plans_same_page():
+    from confluence.api import PagePlan, merge_plans
+    def t1(root):
+        return root
+    def t2(root):
+        return root
+    plans = merge_plans([PagePlan("1").transform(t1), PagePlan("2").rename("two"),
+                         PagePlan("1", space_id="10").transform(t2).rename("one")])
+    assert len(plans) == 2
+    assert plans[0] == PagePlan("1", "one", [t1, t2], "10")
+    assert plans[1] == PagePlan("2", "two", [], None)
+
+
+def test_apply_plan_single_put(monkeypatch):
+    from xml.etree import ElementTree as ET
+    from confluence.api import PagePlan, apply_plan
+    put = Mock(return_value=response(200, {'id': "1"}))
+    monkeypatch.setattr(confluence.api, "put", put)
+
+    def add_h1(root):
+        root.append(ET.Element("h1"))
+        return root
+    handle = PageHandle("1", "old", "10", 3, "<p>body</p>")
+    (sc, _) = apply_plan("url", "auth", PagePlan("1").transform(add_h1).rename("new"), handle=handle)
+    assert sc == 200
+    assert put.call_count == 1
+    payload = json.loads(put.call_args.args[2])
+    assert payload['title'] == "new"
+    assert "<h1 />" in payload['body']['value']
@@ -0,0 +1,96 @@
+import datetime
+from unittest.mock import Mock
+
+import pytest
+
+from confluence.scheduler import Scheduler, TokenBucket, parse_retry_after, endpoint_key
+
+
+def response(status_code, headers={}):
+    return Mock(status_code=status_code, headers=headers)
+
+
+def test_parse_retry_after():
+    now = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Sun, 01 Jan 2023 00:00:10 GMT", now) == 10.0
+    assert parse_retry_after("soon") is None
+
+
+def test_endpoint_key():
+    assert endpoint_key("GET", "https://x.net/wiki/api/v2/pages/123?body-format=storage") == \
+           "GET /wiki/api/v2/pages/{id}"
+
+
+def test_retry_honours_retry_after():
+    now = [0.0]
+    sleeps = []
+    def sleep(s):
+        now[0] += s
+        sleeps.append(s)
+    scheduler = Scheduler(clock=lambda: now[0], sleep=sleep)
+    send = Mock(side_effect=[response(429, {"Retry-After": "2"}), response(200)])
+    res = scheduler.request(send, "GET", "url")
+    assert res.status_code == 200
+    assert send.call_count == 2
+    assert 2.0 in sleeps
+
+
+def test_retry_gives_up():
+    scheduler = Scheduler(max_retries=2, sleep=lambda s: None)
+    send = Mock(return_value=response(503))
+    res = scheduler.request(send, "GET", "url")
+    assert res.status_code == 503
+    assert send.call_count == 3
+
+
+def test_post_connection_error_not_retried():
+    scheduler = Scheduler(sleep=lambda s: None)
+    send = Mock(side_effect=ConnectionError("reset"))
+    with pytest.raises(ConnectionError):
+        scheduler.request(send, "POST", "url")
+    assert send.call_count == 1
+
+
+def test_writes_not_retried_on_503():
+    scheduler = Scheduler(sleep=lambda s: None)
+    for method in ["POST", "PUT"]:
+        send = Mock(side_effect=[response(503), response(200)])
+        assert scheduler.request(send, method, "url").status_code == 503
+        send = Mock(side_effect=[response(429), response(200)])
+        assert scheduler.request(send, method, "url").status_code == 200
+
+
+def test_retried_response_is_closed():
+    scheduler = Scheduler(sleep=lambda s: None)
+    busy = response(503)
+    send = Mock(side_effect=[busy, response(200)])
+    scheduler.request(send, "GET", "url", stream=True)
+    busy.close.assert_called_once()
+
+
+def test_streamed_response_holds_endpoint_slot():
+    scheduler = Scheduler(endpoint_limit=1, sleep=lambda s: None)
+    first = response(200)
+    scheduler.request(Mock(return_value=first), "GET", "url", stream=True)
+    sem = scheduler.semaphore(endpoint_key("GET", "url"))
+    assert not sem.acquire(blocking=False)
+    first.close()
+    first.close()
+    assert sem.acquire(blocking=False)
+    sem.release()
+    # a response that isn't streamed gives the slot back at once
+    scheduler.request(Mock(return_value=response(200)), "GET", "url")
+    assert sem.acquire(blocking=False)
+    sem.release()
+
+
+def test_token_bucket_waits():
+    now = [0.0]
+    def sleep(s):
+        now[0] += s
+    bucket = TokenBucket(rate=2, burst=1, clock=lambda: now[0], sleep=sleep)
+    for _ in range(5):
+        bucket.acquire()
+    assert now[0] == pytest.approx(2.0)
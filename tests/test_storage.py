@@ -0,0 +1,47 @@
+import pytest
+from xml.etree import ElementTree as ET
+from xml.etree.ElementTree import ParseError
+
+from confluence.storage import StorageCodec, default_codec
+
+
+def test_round_trip_keeps_prefixes():
+    value = '<h1>title&nbsp;<ac:emoticon ac:name="smile" /></h1><p a="1&gt;2">text</p>tail'
+    root = default_codec.parse(value)
+    assert root.tag == "root"
+    assert root[0][0].tag == "{https://example.com/ac}emoticon"
+    assert default_codec.serialize(root) == \
+           '<h1>title\xa0<ac:emoticon ac:name="smile" /></h1><p a="1&gt;2">text</p>tail'
+
+
+def test_serialize_empty_and_text_only():
+    assert default_codec.serialize(default_codec.parse("")) == ""
+    assert default_codec.serialize(default_codec.parse("text")) == "text"
+
+
+def test_serialize_other_root():
+    root = ET.Element("root")
+    root.append(ET.Element("{http://example.com/ri}page"))
+    assert default_codec.serialize(root) == "<ri:page />"
+
+
+def test_parse_error_raises():
+    codec = StorageCodec()
+    with pytest.raises(ParseError):
+        codec.parse("<x:tag />")
+
+
+def test_stream_update_tree_same_as_update_tree():
+    from confluence.content import update_tree
+    from confluence.storage import stream_update_tree
+    value = ('<h1>yesterday</h1><p>old</p>\n<h1>today <ac:emoticon ac:name="smile" /></h1>'
+             '<table><tr><td>1</td></tr></table>tail<h2>rest</h2><p>keep</p>')
+    expected = default_codec.serialize(update_tree(default_codec.parse(value)))
+    for n in [1, 5, len(value)]:
+        chunks = [value[i:i + n] for i in range(0, len(value), n)]
+        assert "".join(stream_update_tree(chunks)) == expected
+
+
+def test_iter_top_level_detaches_elements():
+    elements = list(default_codec.iter_top_level(["<p>a</p>t", "ail<h1>b</h1>"]))
+    assert [(e.tag, e.tail) for e in elements] == [("p", "tail"), ("h1", None)]
@@ -0,0 +1,68 @@
+import confluence.aio
+import confluence.api
+import confluence.sync
+from confluence.api import find_page_by_path, get_children
+from confluence.sync import Mirror, sync_space
+
+
+def listing(versions):
+    return [{'id': page_id, 'parentId': parent_id, 'title': title, 'version': {'number': v}}
+            for (page_id, parent_id, title, v) in versions]
+
+
+def test_sync_fetches_only_changed(tmp_path, monkeypatch):
+    fetched = []
+
+    async def get_page_by_id(url, auth, page_id, body_format='storage', body_cache=None):
+        fetched.append(page_id)
+        page = [p for p in remote if p['id'] == page_id][0]
+        return (200, dict(page, body={'storage': {'value': f"<p>{page_id} {page['version']['number']}</p>"}}))
+    monkeypatch.setattr(confluence.aio, "get_page_by_id", get_page_by_id)
+    monkeypatch.setattr(confluence.sync, "list_space_pages", lambda url, auth, space_id: iter(remote))
+    space = {'id': "10", 'homepageId': "1"}
+
+    mirror = Mirror(str(tmp_path))
+    remote = listing([("1", None, "home", 1), ("2", "1", "2000", 1), ("3", "2", "2000-01", 1)])
+    assert sync_space("", None, space, mirror) == (["1", "2", "3"], [])
+
+    fetched.clear()
+    remote = listing([("1", None, "home", 1), ("2", "1", "2000", 2)])
+    assert sync_space("", None, space, mirror) == (["2"], ["3"])
+    assert fetched == ["2"]
+    assert mirror.body("2") == "<p>2 2</p>"
+    assert mirror.body("3") is None
+    mirror.close()
+
+
+def test_mirror_resolves_path(tmp_path, monkeypatch):
+    # test_ordering_page_title.py replaces get_children with a Mock.
+    monkeypatch.setattr(confluence.api, "get_children", get_children)
+    mirror = Mirror(str(tmp_path))
+    for (page_id, parent_id, title) in [("1", None, "home"), ("2", "1", "2000"), ("3", "2", "2000-01")]:
+        mirror.store({'id': page_id, 'title': title, 'version': {'number': 1},
+                      'body': {'storage': {'value': ""}}}, parent_id)
+
+    top_pages = get_children("", None, "1", mirror)
+    assert find_page_by_path("", None, top_pages, ["%Y", "%Y-%m"], mirror) == {'id': "3", 'title': "2000-01"}
+    mirror.close()
+
+
+def test_sync_keeps_pages_fetched_before_failure(tmp_path, monkeypatch):
+    import pytest
+
+    async def get_page_by_id(url, auth, page_id, body_format='storage', body_cache=None):
+        if page_id == "2":
+            # the other page is already in the mirror
+            assert mirror.body("1") == "<p>1</p>"
+            return (500, {})
+        return (200, {'id': page_id, 'title': "home", 'version': {'number': 1},
+                      'body': {'storage': {'value': "<p>1</p>"}}})
+    monkeypatch.setattr(confluence.aio, "get_page_by_id", get_page_by_id)
+    remote = listing([("1", None, "home", 1), ("2", "1", "2000", 1)])
+    monkeypatch.setattr(confluence.sync, "list_space_pages", lambda url, auth, space_id: iter(remote))
+
+    mirror = Mirror(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        sync_space("", None, {'id': "10", 'homepageId': "1"}, mirror, 1)
+    assert mirror.versions() == {"1": 1}
+    mirror.close()
@@ -56,3 +56,38 @@ def test_compare():
     assert compare("h1", "h2") == Ord.GT
     assert compare("h2", "h1") == Ord.LT
 
+
+def test_grouping_keeps_elements():
+    h1 = ET.Element('h1')
+    p = ET.Element('p')
+    res = grouping([h1, p])
+    assert res[0][0] is h1
+    assert res[0][1] is p
+
+def test_iter_groups_lazy():
+    from confluence.content import iter_groups
+    consumed = []
+    def elements():
+        for tag in ['h1', 'p', 'h1', 'p']:
+            consumed.append(tag)
+            yield ET.Element(tag)
+    groups = iter_groups(elements())
+    first = next(groups)
+    assert [e.tag for e in first] == ['h1', 'p']
+    assert consumed == ['h1', 'p', 'h1']
+    assert [[e.tag for e in g] for g in groups] == [['h1', 'p']]
+
+def test_daily_job_shares_duplicated_group():
+    from confluence.content import daily_job, unshare
+    root = ET.fromstring("<root><h1>yesterday</h1><p>old</p><h1>today</h1><table><tr/></table></root>")
+    res = daily_job(grouping(list(root)))
+    assert [[(e.tag, e.text) for e in g] for g in res] == \
+           [[('h1', 'yesterday'), ('table', None)], [('h1', 'today'), ('table', None)]]
+    assert res[0][1] is res[1][1]
+
+    out = ET.Element("root")
+    out.extend([e for g in res for e in g])
+    assert ET.tostring(out) == b"<root><h1>yesterday</h1><table><tr /></table><h1>today</h1><table><tr /></table></root>"
+    unshare(out)
+    assert out[1] is not out[3]
+    assert ET.tostring(out[1]) == ET.tostring(out[3])
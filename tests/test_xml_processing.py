@@ -1,6 +1,7 @@
 import unittest
 from confluence.content import analize_parse_error
 from confluence.xmlcmd import *
+from xml.etree import ElementPath as EP
 def test_analize_parse_error_empty():
     patterns = []
     res = analize_parse_error([], "msg", "parsed data")
@@ -156,3 +157,42 @@ def test_interp_call_function_valid_single():
     res = interpreter([CallFunction(fun, ("tag1",), conv), Insert(1)], root)
     assert res[0].elem[0].tag == "tag1"
 
+
+def test_interp_long_program():
+    root = ET.fromstring("<root><h1>text</h1></root>")
+    res = interpreter([Dup(), Pop()] * 5000, root)
+    assert [*res] == [Node(root)]
+
+def test_compile_xpath_same_as_find():
+    root = ET.fromstring("<root><a><b>1</b></a><a><b>2</b><c/></a></root>")
+    for xp in ["a", "a[2]/b", "./a/c", "a/..", ".//b", "x", "a/"]:
+        assert compile_xpath(xp)(root) is EP.find(root, xp)
+
+def test_compile_xpath_rejects_bad_path():
+    import pytest
+    for xp in ["/a", "a[x y]"]:
+        with pytest.raises(SyntaxError):
+            compile_xpath(xp)
+
+def test_program_reused_over_roots():
+    program = compile_program([GetXPath("h1"), Remove()])
+    roots = [ET.fromstring(f"<root><h1>{i}</h1><p/></root>") for i in range(3)]
+    for root in roots:
+        program.run(root)
+    assert [[e.tag for e in root] for root in roots] == [["p"]] * 3
+
+def test_run_many_bodies_and_errors():
+    program = compile_program([GetXPath("h1"), Remove()])
+    docs = ["<h1>a</h1><p>1</p>", "<p>2</p>", "<h1>b</h1><ac:emoticon ac:name='x' />"]
+    for mode in [None, "thread", "process"]:
+        res = run_many(program, docs, mode, 2)
+        assert res[0] == "<p>1</p>"
+        assert isinstance(res[1], Exception)
+        assert res[2] == '<ac:emoticon ac:name="x" />'
+
+def test_run_many_roots():
+    program = compile_program([Push(ET.Element("tag")), Insert(0)])
+    roots = [ET.fromstring("<root/>") for _ in range(3)]
+    res = run_many(program, roots, "thread")
+    assert [r[0].elem is root for (r, root) in zip(res, roots)] == [True] * 3
+    assert [root[0].tag for root in roots] == ["tag"] * 3